@@ -0,0 +1,319 @@
+"""
+Offline benchmark for the scraper.
+
+Serves synthetic sites from a local HTTP server, one per pagination style the scraper
+handles, crawls each of them and reports pages/sec, time per phase and peak memory.
+No network access is needed.
+
+    python benchmark.py --pages 20 --items 10 --latency-ms 50
+"""
+import argparse
+import asyncio
+import contextlib
+import functools
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import scraper
+
+# style -> path of the first page
+STYLES = {
+    "query": "/query?page=1",        # ?page=N with a 'Next' link in a pagination nav
+    "path": "/path/page/1/",         # /page/N/ with a 'Next' link in .pagination
+    "relnext": "/relnext/1",         # trailing /N with an a[rel=next] arrow
+    "loadmore": "/loadmore",         # one page, 'Load More' button fetching JSON
+    "scroll": "/scroll",             # one page, infinite scroll like quotes.toscrape.com/scroll
+}
+# Phases timed by wrapping the scraper's own coroutines.
+PHASES = ["scrape_over_http", "scrape_with_fanout", "scrape_with_playwright", "handle_dynamic_content_loading"]
+
+PAGE_TEMPLATE = """<!DOCTYPE html><html lang="en"><head><meta charset="UTF-8"><title>{title}</title></head>
+<body><div class="container"><h1>{title}</h1><div class="quotes">{items}</div>{footer}</div>{script}</body></html>"""
+
+# Fetches items from /api/items like the quotes.toscrape.com scroll page, without jQuery.
+# With a button, page 1 is server-rendered and each click appends the next page; without
+# one, page 1 is loaded by the script and later pages arrive when scrolling to the bottom.
+DYNAMIC_SCRIPT = """<script>
+(() => {
+    const quotes = document.querySelector('.quotes');
+    const button = document.querySelector('button');
+    let page = button ? 1 : 0, hasNext = true, loading = false;
+    async function loadNext() {
+        if (!hasNext || loading) return;
+        loading = true;
+        page += 1;
+        const data = await (await fetch('/api/items?page=' + page)).json();
+        quotes.insertAdjacentHTML('beforeend', data.html);
+        hasNext = data.has_next;
+        if (!hasNext && button) button.remove();
+        loading = false;
+    }
+    if (button) {
+        button.addEventListener('click', loadNext);
+    } else {
+        loadNext();
+        window.addEventListener('scroll', () => {
+            if (window.innerHeight + window.scrollY >= document.body.scrollHeight - 2) loadNext();
+        });
+    }
+})();
+</script>"""
+
+
+def item_html(number: int) -> str:
+    return (f'<div class="quote"><span class="text">"Synthetic quote number {number}, padded with '
+            f'enough words to look like a real listing entry."</span><span>by <small class="author">'
+            f'Author {number % 17}</small></span><div class="tags">Tags: <a class="tag">tag-{number % 5}</a> '
+            f'<a class="tag">tag-{number % 7}</a></div></div>')
+
+
+def items_for_page(page: int, per_page: int) -> str:
+    first = (page - 1) * per_page
+    return "".join(item_html(first + i) for i in range(per_page))
+
+
+class FixtureServer(ThreadingHTTPServer):
+    """
+    Local HTTP server for the synthetic sites, run on a background thread.
+    """
+    daemon_threads = True
+
+    def __init__(self, pages: int, items: int, latency_ms: float):
+        super().__init__(("127.0.0.1", 0), FixtureHandler)
+        self.pages = pages
+        self.items = items
+        self.latency = latency_ms / 1000
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, body: str, content_type: str = "text/html; charset=utf-8", status: int = 200):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _listing(self, page: int, next_link: str):
+        pages, items = self.server.pages, self.server.items
+        if not 1 <= page <= pages:
+            return self._send("<h1>Not found</h1>", status=404)
+        footer = next_link if page < pages else ""
+        self._send(PAGE_TEMPLATE.format(title=f"Page {page}", items=items_for_page(page, items),
+                                        footer=footer, script=""))
+
+    def do_GET(self):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        parts = urlsplit(self.path)
+        query = parse_qs(parts.query)
+        segments = [segment for segment in parts.path.split("/") if segment]
+        try:
+            if parts.path == "/query":
+                page = int(query.get("page", ["1"])[0])
+                return self._listing(page, f'<nav aria-label="pagination"><a href="/query?page={page + 1}">Next</a></nav>')
+            if segments[:2] == ["path", "page"] and len(segments) == 3:
+                page = int(segments[2])
+                return self._listing(page, f'<nav class="pagination"><a href="/path/page/{page + 1}/">Next</a></nav>')
+            if segments[:1] == ["relnext"] and len(segments) == 2:
+                page = int(segments[1])
+                return self._listing(page, f'<a rel="next" href="/relnext/{page + 1}">&rsaquo;</a>')
+        except ValueError:
+            return self._send("<h1>Bad page number</h1>", status=400)
+        if parts.path == "/loadmore":
+            return self._send(PAGE_TEMPLATE.format(title="Button feed", items=items_for_page(1, self.server.items),
+                                                   footer='<button class="load-more">Load More</button>',
+                                                   script=DYNAMIC_SCRIPT))
+        if parts.path == "/scroll":
+            return self._send(PAGE_TEMPLATE.format(title="Scrolling feed", items="", footer="",
+                                                   script=DYNAMIC_SCRIPT))
+        if parts.path == "/api/items":
+            page = int(query.get("page", ["1"])[0])
+            payload = {"page": page, "has_next": page < self.server.pages,
+                       "html": items_for_page(page, self.server.items) if page <= self.server.pages else ""}
+            return self._send(json.dumps(payload), "application/json")
+        self._send("<h1>Not found</h1>", status=404)
+
+
+class PhaseTimer:
+    """
+    Wraps the scraper's phase coroutines so every call adds to a per-phase total.
+    """
+    def __init__(self, names: list):
+        self.totals = {name: 0.0 for name in names}
+        self.calls = {name: 0 for name in names}
+        self._originals = {name: getattr(scraper, name) for name in names}
+
+    def install(self):
+        for name, original in self._originals.items():
+            setattr(scraper, name, self._timed(name, original))
+
+    def uninstall(self):
+        for name, original in self._originals.items():
+            setattr(scraper, name, original)
+
+    def reset(self):
+        for name in self.totals:
+            self.totals[name] = 0.0
+            self.calls[name] = 0
+
+    def _timed(self, name: str, function):
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await function(*args, **kwargs)
+            finally:
+                self.totals[name] += time.perf_counter() - started
+                self.calls[name] += 1
+        return wrapper
+
+
+async def sample_browser_rss(pool: scraper.BrowserPool, peak: list, interval: float = 0.25):
+    while True:
+        peak[0] = max(peak[0], await pool.total_rss_bytes())
+        await asyncio.sleep(interval)
+
+
+def count_items(store: scraper.PageStore) -> int:
+    """
+    Counts the quote items in everything a crawl stored, pages and JSON payloads alike.
+    """
+    total = 0
+    for entry in store.load_index().values():
+        body = store.read(entry["sha256"], entry["codec"], entry.get("media", "html"))
+        total += body.count('class="quote"') + body.count('class=\\"quote\\"')
+    return total
+
+
+async def run_style(style: str, server: FixtureServer, pool: scraper.BrowserPool, timer: PhaseTimer,
+                    args, workdir: str) -> dict:
+    single_page = style in ("loadmore", "scroll")
+    job = scraper.CrawlJob.from_dict({
+        "url": server.base_url + STYLES[style],
+        "id": style,
+        "output_dir": os.path.join(workdir, style),
+        "max_pages": 1 if single_page else server.pages,
+        "max_restarts": 1,
+        "fanout": args.fanout,
+        "http_first": args.http_first,
+    })
+    job.selector_cache = scraper.SelectorCache()
+    job.tracer = scraper.PhaseTracer()
+    job.rate_limiter = scraper.HostRateLimiter(rate=args.rate)
+    if job.http_first:
+        job.http_engine = scraper.HttpFirstEngine()
+
+    timer.reset()
+    tracemalloc.reset_peak()
+    browser_peak = [0]
+    sampler = asyncio.create_task(sample_browser_rss(pool, browser_peak))
+    log = io.StringIO()
+    started = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(log) if not args.verbose else contextlib.nullcontext():
+            await scraper.run_crawl(job, pool)
+    finally:
+        elapsed = time.perf_counter() - started
+        sampler.cancel()
+    pages = len(job.visited_urls)
+    return {
+        "style": style,
+        "pages": pages,
+        "items": count_items(job.sink.store),
+        "expected_items": server.pages * server.items,
+        "seconds": round(elapsed, 3),
+        "pages_per_second": round(pages / elapsed, 3) if elapsed else 0,
+        "phases": {name: {"seconds": round(timer.totals[name], 3), "calls": timer.calls[name]}
+                   for name in timer.totals if timer.calls[name]},
+        "page_phases": {name: {"count": histogram.count, "seconds": round(histogram.sum, 3),
+                               "p95_at_most": histogram.quantile(0.95)}
+                        for name, histogram in sorted(job.tracer.histograms.items())},
+        "python_peak_mb": round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 1),
+        "browser_peak_mb": round(browser_peak[0] / (1024 * 1024), 1),
+    }
+
+
+def print_report(results: list):
+    print(f"\n{'style':<10}{'pages':>7}{'items':>13}{'seconds':>10}{'pages/s':>9}{'py MB':>8}{'browser MB':>12}")
+    for result in results:
+        items = f"{result['items']}/{result['expected_items']}"
+        print(f"{result['style']:<10}{result['pages']:>7}{items:>13}{result['seconds']:>10.2f}"
+              f"{result['pages_per_second']:>9.2f}{result['python_peak_mb']:>8.1f}{result['browser_peak_mb']:>12.1f}")
+        for name, phase in result["phases"].items():
+            print(f"{'':<10}  {name:<32}{phase['seconds']:>8.2f}s over {phase['calls']} calls")
+        for name, phase in result["page_phases"].items():
+            print(f"{'':<10}    {name:<30}{phase['seconds']:>8.2f}s over {phase['count']} events, "
+                  f"p95 <= {phase['p95_at_most']:g}s")
+
+
+async def main(args):
+    styles = args.styles or list(STYLES)
+    server = FixtureServer(args.pages, args.items, args.latency_ms).start()
+    print(f"Fixture server on {server.base_url}: {args.pages} pages x {args.items} items, "
+          f"{args.latency_ms:g} ms latency.")
+    timer = PhaseTimer(PHASES)
+    timer.install()
+    tracemalloc.start()
+    pool = await scraper.BrowserPool().start()
+    results = []
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            for style in styles:
+                print(f"-> Benchmarking '{style}'...")
+                results.append(await run_style(style, server, pool, timer, args, workdir))
+    finally:
+        await pool.close()
+        timer.uninstall()
+        tracemalloc.stop()
+        server.stop()
+
+    print_report(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nWrote results to {args.output}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmark for scraper.py")
+    parser.add_argument("--styles", nargs="+", choices=list(STYLES),
+                        help="Pagination styles to run (default: all).")
+    parser.add_argument("--pages", type=int, default=10, help="Pages per site (default: 10).")
+    parser.add_argument("--items", type=int, default=10, help="Items per page (default: 10).")
+    parser.add_argument("--latency-ms", type=float, default=0, help="Delay added to every response.")
+    parser.add_argument("--fanout", type=int, default=0, help="Passed through to the crawl jobs.")
+    parser.add_argument("--rate", type=float, default=0,
+                        help="Requests per second against the fixture server (default: 0, no limit).")
+    parser.add_argument("--http-first", action="store_true",
+                        help="Let jobs try plain HTTP before Playwright (default: Playwright only).")
+    parser.add_argument("--output", metavar="JSON", help="Also write the results to this file.")
+    parser.add_argument("--verbose", action="store_true", help="Show the scraper's own output.")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
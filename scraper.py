@@ -1,118 +1,1969 @@
+import argparse
 import asyncio
+import gzip
+import hashlib
+import importlib.util
+import json
+import math
 import re
 import random
 import os
-from playwright.async_api import async_playwright, TimeoutError
+import sqlite3
+import threading
+import time
+from array import array
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
+from dataclasses import dataclass, field
+from html.parser import HTMLParser
+from urllib.parse import parse_qsl, urlencode, urljoin, urlsplit, urlunsplit
+from playwright.async_api import async_playwright
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional; pages are gzipped without it
+    zstandard = None
+
+try:
+    import lxml.html
+    from lxml import etree
+except ImportError:  # lxml is only needed for structured extraction
+    lxml = etree = None
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36"
+
+def _process_rss_bytes(pid: int) -> int:
+    """
+    Reads the resident memory of a process from /proc. Returns 0 where that is unavailable.
+    """
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            resident_pages = int(f.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return 0
+    return resident_pages * os.sysconf("SC_PAGE_SIZE")
+
+@dataclass
+class CrawlJob:
+    """
+    One crawl: a start URL, its limits, and the state that belongs to it alone.
+    """
+    start_url: str
+    job_id: str = ""
+    output_dir: str = "scraped_pages"
+    max_restarts: int = 30
+    max_pages: int = 0  # 0 means no limit
+    fanout: int = 0  # tabs used to fetch numbered pages directly; 0 or 1 clicks 'Next' instead
+    compression: str = None  # "zstd" or "gzip"; None picks zstd when it is installed
+    resume: bool = False
+    block_resources: bool = True
+    block_types: list = None  # None means ResourcePolicy.DEFAULT_TYPES
+    block_hosts: list = field(default_factory=list)  # added to ResourcePolicy.DEFAULT_HOSTS
+    block_patterns: list = field(default_factory=list)  # URL substrings to block
+    http_first: bool = True
+    expect_markers: list = field(default_factory=list)  # strings a complete page must contain
+    api_replay: bool = False  # page through the JSON API behind scroll/load-more instead of the DOM
+    api_max_requests: int = 500
+    harvest_selector: str = None  # CSS for feed items to stream out after every scroll round
+    evict_harvested: bool = False  # drop harvested items from the live DOM to keep it small
+    # Budgets for dynamic loading on one page; 0 disables a budget.
+    max_load_seconds: float = 300
+    max_load_rounds: int = 500
+    max_dom_nodes: int = 0
+    max_js_heap_mb: float = 0
+    pagination: "PaginationModel" = None  # learned from the job's first page URLs
+    schema: dict = None  # extraction spec for this site; see extract_records()
+    extract_in_browser: bool = False  # run the schema inside the page and keep records instead of HTML
+    page_hash: bool = False  # with extract_in_browser, also record a hash of the rendered HTML
+    visited_store: str = "hash"  # "hash", "bloom" or "disk"; see make_visited_store()
+    visited_capacity: int = 10_000_000  # URLs a bloom store is sized for
+    strip_params: list = field(default_factory=list)  # query parameters ignored when comparing URLs
+    keep_fragments: bool = False  # treat every #fragment as part of the page's identity
+    rate: float = None  # requests per second for this job's host; None uses the run's default
+    burst: float = None
+    visited_urls: "VisitedStore" = field(default_factory=lambda: HashVisitedStore())
+    sink: "PageSink" = None
+    checkpoint: "CrawlCheckpoint" = None
+    resource_policy: "ResourcePolicy" = None
+    http_engine: "HttpFirstEngine" = None  # shared by every job in the run
+    selector_cache: "SelectorCache" = None  # shared by every job in the run
+    tracer: "PhaseTracer" = field(default_factory=lambda: PhaseTracer())  # replaced by the run's shared tracer
+    metrics: "Metrics" = field(default_factory=lambda: Metrics())  # replaced by the run's shared metrics
+    retry_policy: "RetryPolicy" = field(default_factory=lambda: RetryPolicy())  # replaced by the run's shared policy
+    rate_limiter: "HostRateLimiter" = field(default_factory=lambda: HostRateLimiter())  # shared by the run
+    extract_pool: ProcessPoolExecutor = None  # shared by every job in the run
+    extractor: "ExtractionPipeline" = None
+
+    @classmethod
+    def from_dict(cls, data: dict, defaults: dict = None):
+        """
+        Builds a job from one JSONL entry. Keys missing from the entry fall back to `defaults`.
+        """
+        settings = {**(defaults or {}), **data}
+        start_url = normalize_start_url(data.get("url") or data.get("start_url") or "")
+        if not start_url:
+            raise ValueError("job has no 'url'")
+        job_id = str(data.get("id") or data.get("job_id") or re.sub(r'[^\w\-.]', '_', start_url))
+        return cls(
+            start_url=start_url,
+            job_id=job_id,
+            output_dir=data.get("output_dir") or os.path.join(settings.get("output_dir", "scraped_pages"), job_id),
+            max_restarts=int(settings.get("max_restarts", 30)),
+            max_pages=int(settings.get("max_pages", 0)),
+            fanout=int(settings.get("fanout", 0)),
+            compression=settings.get("compression"),
+            resume=bool(settings.get("resume", False)),
+            block_resources=bool(settings.get("block_resources", True)),
+            block_types=settings.get("block_types"),
+            block_hosts=list(settings.get("block_hosts") or []),
+            block_patterns=list(settings.get("block_patterns") or []),
+            http_first=bool(settings.get("http_first", True)),
+            expect_markers=list(settings.get("expect_markers") or []),
+            api_replay=bool(settings.get("api_replay", False)),
+            api_max_requests=int(settings.get("api_max_requests", 500)),
+            harvest_selector=settings.get("harvest_selector"),
+            evict_harvested=bool(settings.get("evict_harvested", False)),
+            max_load_seconds=float(settings.get("max_load_seconds", 300)),
+            max_load_rounds=int(settings.get("max_load_rounds", 500)),
+            max_dom_nodes=int(settings.get("max_dom_nodes", 0)),
+            max_js_heap_mb=float(settings.get("max_js_heap_mb", 0)),
+            schema=data.get("schema") or schema_for_url(start_url, settings.get("schemas")),
+            visited_store=settings.get("visited_store") or "hash",
+            visited_capacity=int(settings.get("visited_capacity") or 10_000_000),
+            strip_params=list(settings.get("strip_params") or []),
+            keep_fragments=bool(settings.get("keep_fragments", False)),
+            rate=float(data["rate"]) if data.get("rate") is not None else None,
+            burst=float(data["burst"]) if data.get("burst") is not None else None,
+            extract_in_browser=bool(settings.get("extract_in_browser", False)),
+            page_hash=bool(settings.get("page_hash", False)),
+        )
+
+def schema_for_url(url: str, schemas: dict) -> dict:
+    """
+    Picks the extraction spec for a URL from a {host: spec} mapping. "www." is ignored.
+    """
+    if not schemas:
+        return None
+    host = (urlsplit(url).hostname or "").removeprefix("www.")
+    return schemas.get(host) or schemas.get(f"www.{host}")
+
+def normalize_start_url(url: str) -> str:
+    url = url.strip()
+    if url and not re.match(r'^https?:\/\/', url):
+        url = f"https://{url}"
+        print(f"Assuming you meant: {url}")
+    return url
+
+def load_jobs(path: str, defaults: dict = None) -> list:
+    """
+    Reads crawl jobs from a JSONL file, one JSON object per line. Bad lines are reported and skipped.
+    """
+    jobs = []
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                jobs.append(CrawlJob.from_dict(json.loads(line), defaults))
+            except (ValueError, TypeError, AttributeError) as e:
+                print(f"[!] Skipping job on line {line_number} of {path}: {e}")
+    return jobs
+
+class ResourcePolicy:
+    """
+    Aborts requests the scraper never needs (images, media, fonts, analytics and ad hosts)
+    through context.route, and keeps count of what it blocked.
+    Blocked requests are never sent, so bytes saved are estimated from typical sizes per type.
+    """
+    DEFAULT_TYPES = ["image", "media", "font"]
+    DEFAULT_HOSTS = [
+        "google-analytics.com", "googletagmanager.com", "doubleclick.net", "googlesyndication.com",
+        "adservice.google.com", "facebook.net", "hotjar.com", "segment.io", "segment.com",
+        "mixpanel.com", "clarity.ms", "scorecardresearch.com", "quantserve.com", "criteo.com",
+        "taboola.com", "outbrain.com", "amazon-adsystem.com", "nr-data.net",
+    ]
+    TYPICAL_BYTES = {"image": 60_000, "media": 500_000, "font": 40_000, "script": 30_000,
+                     "stylesheet": 20_000}
+
+    def __init__(self, resource_types: list = None, hosts: list = (), url_patterns: list = ()):
+        self.resource_types = set(self.DEFAULT_TYPES if resource_types is None else resource_types)
+        self.hosts = tuple(self.DEFAULT_HOSTS) + tuple(hosts)
+        self.url_patterns = tuple(url_patterns)
+        self.blocked_by_type = Counter()
+        self.estimated_bytes_saved = 0
+
+    @classmethod
+    def for_job(cls, job: CrawlJob):
+        return cls(job.block_types, job.block_hosts, job.block_patterns)
+
+    @property
+    def blocked_requests(self) -> int:
+        return sum(self.blocked_by_type.values())
+
+    def should_block(self, resource_type: str, url: str) -> bool:
+        if resource_type in self.resource_types:
+            return True
+        host = urlsplit(url).hostname or ""
+        if any(host == blocked or host.endswith("." + blocked) for blocked in self.hosts):
+            return True
+        return any(pattern in url for pattern in self.url_patterns)
+
+    async def install(self, context):
+        await context.route("**/*", self._handle_route)
+
+    async def _handle_route(self, route):
+        request = route.request
+        if self.should_block(request.resource_type, request.url):
+            self.blocked_by_type[request.resource_type] += 1
+            self.estimated_bytes_saved += self.TYPICAL_BYTES.get(request.resource_type, 5_000)
+            await route.abort("blockedbyclient")
+        else:
+            await route.continue_()
+
+    def summary(self) -> str:
+        by_type = ", ".join(f"{kind}: {count}" for kind, count in self.blocked_by_type.most_common())
+        return (f"Blocked {self.blocked_requests} requests ({by_type or 'none'}), "
+                f"~{self.estimated_bytes_saved // 1024} KB saved (estimated).")
+
+class SelectorCache:
+    """
+    Remembers, per host, which selector found the 'Next' or 'Load more' control, with hit
+    and miss counts, and persists it as JSON between runs. Known-good selectors are tried
+    first; one that misses max_consecutive_misses times in a row, or has not hit for
+    max_age_days, is forgotten.
+    """
+    def __init__(self, path: str = None, max_consecutive_misses: int = 3, max_age_days: float = 30):
+        self.path = path
+        self.max_consecutive_misses = max_consecutive_misses
+        self.max_age_seconds = max_age_days * 86400
+        self.hosts = {}  # host -> kind -> selector -> {"hits", "misses", "consecutive_misses", "last_hit"}
+        if path and os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    self.hosts = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"[!] Ignoring unreadable selector cache {path}: {e}")
+
+    def _entries(self, host: str, kind: str) -> dict:
+        return self.hosts.setdefault(host or "", {}).setdefault(kind, {})
+
+    def known_good(self, host: str, kind: str) -> list:
+        """
+        Returns the live selectors for host/kind, best first, dropping expired ones.
+        """
+        entries = self._entries(host, kind)
+        now = time.time()
+        for selector, stats in list(entries.items()):
+            if now - stats["last_hit"] > self.max_age_seconds:
+                del entries[selector]
+        return sorted(entries, key=lambda selector: (-entries[selector]["hits"], entries[selector]["misses"]))
+
+    def ordered(self, host: str, kind: str, selectors: list) -> list:
+        known = [selector for selector in self.known_good(host, kind) if selector in selectors]
+        return known + [selector for selector in selectors if selector not in known]
+
+    def record(self, host: str, kind: str, matched_selector, tried: list = None):
+        """
+        Records which selector matched on a page (None if none did). `tried` lists the
+        selectors that were actually tested (default: all of them); known-good ones among
+        them that did not match take a miss and expire after too many misses in a row.
+        Returns "hit" (a known selector matched), "learned" (a new one did) or "none".
+        """
+        entries = self._entries(host, kind)
+        outcome = "hit" if matched_selector in entries else "learned" if matched_selector else "none"
+        for selector, stats in list(entries.items()):
+            if selector == matched_selector or (tried is not None and selector not in tried):
+                continue
+            stats["misses"] += 1
+            stats["consecutive_misses"] += 1
+            if stats["consecutive_misses"] >= self.max_consecutive_misses:
+                print(f"-> Forgetting stale {kind} selector for {host}: '{selector}'")
+                del entries[selector]
+        if matched_selector is not None:
+            stats = entries.setdefault(matched_selector, {"hits": 0, "misses": 0, "consecutive_misses": 0})
+            stats["hits"] += 1
+            stats["consecutive_misses"] = 0
+            stats["last_hit"] = time.time()
+        return outcome
+
+    def save(self):
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary_path = f"{self.path}.tmp"
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            json.dump(self.hosts, f, indent=2, sort_keys=True)
+        os.replace(temporary_path, self.path)
+
+class Histogram:
+    """
+    Fixed-bucket histogram of durations in seconds, with Prometheus-style bucket bounds.
+    """
+    BOUNDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+    def __init__(self):
+        self.bucket_counts = [0] * (len(self.BOUNDS) + 1)  # last bucket is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        index = 0
+        while index < len(self.BOUNDS) and value > self.BOUNDS[index]:
+            index += 1
+        self.bucket_counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """
+        Upper bound of the bucket holding the q-th quantile (inf if it is past the last bound).
+        """
+        target, seen = q * self.count, 0
+        for bound, bucket_count in zip(self.BOUNDS + (float("inf"),), self.bucket_counts):
+            seen += bucket_count
+            if seen >= target:
+                return bound
+        return float("inf")
+
+class PhaseTracer:
+    """
+    Times the phases of every page's lifecycle (goto, click/scroll rounds, content capture,
+    'Next' discovery, pre-click sleep, click, wait_for_url). Each phase feeds a histogram,
+    and with a path it is also written as one JSON event per line.
+    """
+    def __init__(self, path: str = None):
+        self.histograms = {}
+        self._file = open(path, "a", encoding="utf-8", buffering=1) if path else None
+
+    @contextmanager
+    def phase(self, name: str, url: str, **fields):
+        """
+        Times the body of a `with` block; the yielded dict can add fields such as byte counts.
+        """
+        event = dict(fields)
+        started = time.perf_counter()
+        try:
+            yield event
+        except BaseException as e:
+            event["error"] = type(e).__name__
+            raise
+        finally:
+            self.record(name, url, time.perf_counter() - started, **event)
+
+    def record(self, name: str, url: str, seconds: float, **fields):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        histogram.observe(seconds)
+        if self._file is not None:
+            event = {"at": time.time(), "phase": name, "url": url, "host": urlsplit(url or "").hostname,
+                     "seconds": round(seconds, 6), **fields}
+            self._file.write(json.dumps(event) + "\n")
+
+    def summary(self) -> str:
+        lines = [f"{'phase':<18}{'count':>7}{'mean':>9}{'p50<=':>8}{'p95<=':>8}"]
+        for name, histogram in sorted(self.histograms.items()):
+            mean = histogram.sum / histogram.count
+            lines.append(f"{name:<18}{histogram.count:>7}{mean:>8.3f}s{histogram.quantile(0.5):>7g}s"
+                         f"{histogram.quantile(0.95):>7g}s")
+        return "\n".join(lines)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+class HostRateLimiter:
+    """
+    Token bucket per host, shared by every job in the run, so concurrent sessions on one
+    site together stay under its rate. Each page load, click and HTTP/API request takes a
+    token. Up to `burst` tokens build up while pages are being processed, and `jitter` adds
+    a random extra wait of up to that fraction of one interval. A rate of 0 means no limit.
+    """
+    def __init__(self, rate: float = 0.4, burst: float = 1, jitter: float = 0.5):
+        self.rate = rate
+        self.burst = burst
+        self.jitter = jitter
+        self.host_limits = {}  # host -> (rate, burst)
+        self._buckets = {}  # host without "www." -> (tokens, last refill time)
+        self._locks = {}
+
+    def configure(self, host: str, rate: float, burst: float = None):
+        self.host_limits[host.removeprefix("www.")] = (rate, burst if burst is not None else self.burst)
+
+    def limits_for(self, host: str):
+        return self.host_limits.get(host.removeprefix("www."), (self.rate, self.burst))
+
+    async def wait(self, url: str) -> float:
+        """
+        Waits for a token for the URL's host. Returns the seconds spent waiting.
+        """
+        # www.example.com and example.com share one bucket, as they share one limit.
+        host = (urlsplit(url).hostname or "").removeprefix("www.")
+        rate, burst = self.limits_for(host)
+        if rate <= 0:
+            return 0.0
+        lock = self._locks.get(host)
+        if lock is None:
+            lock = self._locks[host] = asyncio.Lock()
+        # Waiters on one host queue behind the lock, so tokens go out in arrival order.
+        async with lock:
+            now = time.monotonic()
+            tokens, last = self._buckets.get(host, (burst, now))
+            tokens = min(burst, tokens + (now - last) * rate)
+            delay = max(0.0, (1 - tokens) / rate)
+            if self.jitter:
+                delay += random.uniform(0, self.jitter) / rate
+            if delay:
+                await asyncio.sleep(delay)
+            now_after = time.monotonic()
+            tokens = min(burst, tokens + (now_after - now) * rate) - 1
+            self._buckets[host] = (tokens, now_after)
+        return delay
+
+class Metrics:
+    """
+    Live counters for long-running crawls, rendered in the Prometheus text format.
+    Incrementing is a locked dict update, so the hot path stays cheap; phase latency
+    histograms come from the tracer and browser RSS is only read when scraped.
+    """
+    HELP = {
+        "scraper_pages_captured_total": ("counter", "Pages captured and queued for storage."),
+        "scraper_bytes_captured_total": ("counter", "Uncompressed bytes handed to the page store."),
+        "scraper_bytes_stored_total": ("counter", "Bytes written to the page store after compression and deduplication."),
+        "scraper_restarts_total": ("counter", "Sessions retried after a failure, by failure kind."),
+        "scraper_selector_lookups_total": ("counter", "Selector probes by control kind and selector-cache outcome."),
+        "scraper_skip_recoveries_total": ("counter", "Skipped pages recovered inside the live session, by method."),
+    }
+
+    def __init__(self):
+        self.counters = {}  # (name, sorted label items) -> value
+        self.tracer = None
+        self.pool = None
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    @staticmethod
+    def _labels(labels) -> str:
+        if not labels:
+            return ""
+        def escape(value) -> str:
+            return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in labels) + "}"
+
+    @staticmethod
+    def _number(value) -> str:
+        # Exact, unlike :g, which rounds byte counters to six significant digits.
+        return str(value) if isinstance(value, int) else repr(float(value))
+
+    async def render(self) -> str:
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+        described = set()
+        for (name, labels), value in counters:
+            if name not in described:
+                kind, help_text = self.HELP.get(name, ("counter", name))
+                lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+                described.add(name)
+            lines.append(f"{name}{self._labels(labels)} {self._number(value)}")
+
+        if self.tracer is not None and self.tracer.histograms:
+            lines += ["# HELP scraper_phase_seconds Time spent in each page phase.",
+                      "# TYPE scraper_phase_seconds histogram"]
+            for phase, histogram in sorted(self.tracer.histograms.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(Histogram.BOUNDS + ("+Inf",), histogram.bucket_counts):
+                    cumulative += bucket_count
+                    labels = self._labels((("phase", phase), ("le", bound)))
+                    lines.append(f"scraper_phase_seconds_bucket{labels} {cumulative}")
+                lines.append(f'scraper_phase_seconds_sum{{phase="{phase}"}} {self._number(histogram.sum)}')
+                lines.append(f'scraper_phase_seconds_count{{phase="{phase}"}} {histogram.count}')
+
+        if self.pool is not None:
+            lines += ["# HELP scraper_browser_rss_bytes Resident memory of all pooled browsers.",
+                      "# TYPE scraper_browser_rss_bytes gauge",
+                      f"scraper_browser_rss_bytes {await self.pool.total_rss_bytes()}",
+                      "# HELP scraper_browser_launches_total Browser processes launched by the pool.",
+                      "# TYPE scraper_browser_launches_total counter",
+                      f"scraper_browser_launches_total {self.pool.launch_count}"]
+        return "\n".join(lines) + "\n"
+
+async def start_metrics_server(metrics: Metrics, port: int, host: str = "127.0.0.1"):
+    """
+    Serves metrics.render() at http://host:port/metrics. Returns the asyncio server.
+    """
+    async def handle(reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 5)
+            while (await asyncio.wait_for(reader.readline(), 5)).strip():
+                pass  # headers are not needed
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[1].split("?")[0] == "/metrics":
+                status, body = "200 OK", (await metrics.render()).encode("utf-8")
+            else:
+                status, body = "404 Not Found", b"Not found. Try /metrics\n"
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                         f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1") + body)
+            await writer.drain()
+        except Exception:
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
+
+class BrowserPool:
+    """
+    Keeps Chromium instances alive across scraping sessions and hands out warm contexts.
+    A browser is only relaunched when its health check finds it crashed, hung or bloated.
+    """
+    def __init__(self, size: int = 1, max_rss_mb: int = 1500, health_timeout: float = 5.0):
+        self.size = size
+        self.max_rss_bytes = max_rss_mb * 1024 * 1024
+        self.health_timeout = health_timeout
+        self.launch_count = 0
+        self._playwright = None
+        self._browsers = []
+        self._retired = set()  # replaced browsers that still have contexts open
+        self._next_index = 0
+        self._lock = asyncio.Lock()
+
+    async def start(self):
+        self._playwright = await async_playwright().start()
+        for _ in range(self.size):
+            self._browsers.append(await self._launch())
+        return self
+
+    async def _launch(self):
+        self.launch_count += 1
+        print(f"-> Launching browser instance (launch #{self.launch_count}).")
+        return await self._playwright.chromium.launch(headless=True)
+
+    async def _discard(self, browser):
+        try:
+            await asyncio.wait_for(browser.close(), self.health_timeout)
+        except Exception:
+            pass
+
+    async def browser_rss_bytes(self, browser) -> int:
+        """
+        Sums the resident memory of every process belonging to a browser instance.
+        """
+        cdp = await browser.new_browser_cdp_session()
+        try:
+            info = await cdp.send("SystemInfo.getProcessInfo")
+        finally:
+            await cdp.detach()
+        return sum(_process_rss_bytes(process["id"]) for process in info.get("processInfo", []))
+
+    async def total_rss_bytes(self) -> int:
+        """
+        Resident memory of every browser in the pool, or 0 where it can't be read.
+        """
+        total = 0
+        for browser in list(self._browsers):
+            try:
+                total += await asyncio.wait_for(self.browser_rss_bytes(browser), self.health_timeout)
+            except Exception:
+                pass
+        return total
+
+    async def check_health(self, browser):
+        """
+        Returns None for a healthy browser, otherwise a short reason why it should be replaced.
+        """
+        if not browser.is_connected():
+            return "crashed"
+        try:
+            cdp = await asyncio.wait_for(browser.new_browser_cdp_session(), self.health_timeout)
+            await asyncio.wait_for(cdp.send("Browser.getVersion"), self.health_timeout)
+            await cdp.detach()
+        except Exception:
+            return "hung"
+        try:
+            rss = await asyncio.wait_for(self.browser_rss_bytes(browser), self.health_timeout)
+        except Exception:
+            # Memory usage is best-effort; an unreadable figure is not a reason to relaunch.
+            return None
+        if self.max_rss_bytes and rss > self.max_rss_bytes:
+            return f"using {rss // (1024 * 1024)} MB"
+        return None
+
+    async def _replace(self, index: int, reason: str):
+        """
+        Puts a freshly launched browser in slot `index`. The old one is retired rather than
+        closed: other jobs may still have contexts on it, so it only stops getting new ones
+        and is closed when its last context is released (or right away if it is dead).
+        """
+        old = self._browsers[index]
+        print(f"[!] Browser instance unhealthy ({reason}). Relaunching...")
+        self._browsers[index] = await self._launch()
+        if old.is_connected() and old.contexts:
+            self._retired.add(old)
+        else:
+            await self._discard(old)
+        return self._browsers[index]
+
+    async def acquire(self, index: int = None):
+        """
+        Returns a new context on the next healthy browser (or on slot `index`),
+        relaunching it first if needed.
+        """
+        async with self._lock:
+            if index is None:
+                index = self._next_index % len(self._browsers)
+                self._next_index += 1
+            browser = self._browsers[index]
+            reason = await self.check_health(browser)
+            if reason:
+                browser = await self._replace(index, reason)
+        return await browser.new_context(user_agent=USER_AGENT)
+
+    async def renew(self, context):
+        """
+        Hands a context back for another session. It is kept warm if its browser is still
+        healthy; otherwise it is dropped and a context on that browser's replacement is returned.
+        """
+        browser = context.browser
+        if browser in self._browsers and await self.check_health(browser) is None:
+            for page in context.pages:
+                try:
+                    await page.close()
+                except Exception:
+                    pass
+            return context
+        # Stay on the failed browser's slot, so it is the one that gets replaced.
+        index = self._browsers.index(browser) if browser in self._browsers else None
+        await self.release(context)
+        return await self.acquire(index)
+
+    async def release(self, context):
+        browser = context.browser
+        try:
+            await context.close()
+        except Exception:
+            pass
+        if browser in self._retired and not browser.contexts:
+            self._retired.discard(browser)
+            await self._discard(browser)
+
+    async def close(self):
+        for browser in self._browsers + list(self._retired):
+            await self._discard(browser)
+        self._browsers = []
+        self._retired = set()
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+
+_LEGACY_PAGE_PATTERNS = (re.compile(r'[?&](?:page|p)=(\d+)'), re.compile(r'/page/(\d+)'), re.compile(r'/(\d+)/?$'))
 
 def get_page_number(url: str) -> int:
     """
     Parses a URL to find a page number from various common pagination formats.
+    Falls back to 1; PaginationModel covers offsets, cursors and fragments and can say "unknown".
     """
-    # Pattern 1: Look for ?p=... or ?page=... or &p=... or &page=...
-    match = re.search(r'[?&](?:page|p)=(\d+)', url)
-    if match:
-        return int(match.group(1))
+    # ?p=... / ?page=..., then /page/..., then a number at the very end of the URL path
+    for pattern in _LEGACY_PAGE_PATTERNS:
+        match = pattern.search(url)
+        if match:
+            return int(match.group(1))
+    return 1
 
-    # Pattern 2: Look for /page/...
-    match = re.search(r'/page/(\d+)', url)
-    if match:
-        return int(match.group(1))
+# Query parameter vocabularies shared by URL pagination (PaginationModel) and API replay.
+PAGE_PARAM_NAMES = {"page", "p", "pg", "paged", "pageno", "page_no", "pagenum", "page_num", "pagenumber",
+                    "page_number", "pageindex", "page_index", "currentpage"}
+OFFSET_PARAM_NAMES = {"offset", "start", "skip", "from", "begin", "startindex", "start_index"}
+CURSOR_PARAM_NAMES = {"cursor", "after", "before", "next", "token", "page_token", "pagetoken", "continuation",
+                      "max_id", "since_id", "starting_after", "pageafter"}
+
+_URL_PARAM_RE = re.compile(r'(?:^|[?&;!/])([^=&;#/?]+=)([^&;#]*)')
+_DIGITS_RE = re.compile(r'\d+')
+
+def _pagination_slots(url: str):
+    """
+    Lists every place in a URL that could carry a page position, as
+    (location, key, value, start, end) with the value's span in the URL. `location` is
+    "query", "path" or "fragment"; `key` is "name=" for parameters and a segment shape
+    such as "page/{}" or "page-{}.html" for numbers in the path.
+    """
+    before_fragment, has_fragment, fragment = url.partition('#')
+    before_query, has_query, query = before_fragment.partition('?')
+    path_start = before_query.find('/', before_query.find('://') + 3) if '://' in before_query else 0
+    regions = [("path", before_query[path_start:], path_start) if path_start >= 0 else None]
+    if has_query:
+        regions.append(("query", query, len(before_query) + 1))
+    if has_fragment:
+        regions.append(("fragment", fragment, len(before_fragment) + 1))
+
+    slots = []
+    for location, text, offset in filter(None, regions):
+        if location != "path":
+            for match in _URL_PARAM_RE.finditer(text):
+                start, end = match.span(2)
+                slots.append((location, match.group(1).lower(), match.group(2), offset + start, offset + end))
+        if location == "query":
+            continue
+        previous, position = "", 0
+        for segment in text.split('/'):
+            numbers = list(_DIGITS_RE.finditer(segment)) if '=' not in segment else []
+            if numbers:
+                number = numbers[-1]
+                prefix, suffix = segment[:number.start()], segment[number.end():]
+                key = f"{previous}/{{}}" if not prefix and not suffix else f"{prefix}{{}}{suffix}"
+                slots.append((location, key, number.group(), offset + position + number.start(),
+                              offset + position + number.end()))
+            previous = segment
+            position += len(segment) + 1
+    return slots
+
+@lru_cache(maxsize=256)
+def _slot_pattern(location: str, key: str):
+    scope = {"path": r'^[^?#]*?/', "query": r'^[^#]*?[?&;]', "fragment": r'#(?:[^#]*?[!&;?/])?'}[location]
+    if key.endswith("="):
+        return re.compile(scope + re.escape(key) + r'([^&;#]*)', re.IGNORECASE)
+    prefix, suffix = key.split("{}", 1)
+    if prefix == "/":  # a number right after the host, or at the start of the fragment
+        scope, prefix = (r'^[^:/?#]+://[^/?#]*/', "") if location == "path" else (r'#/?', "")
+    return re.compile(scope + re.escape(prefix) + r'(\d+)' + re.escape(suffix) + r'(?=[/?#&;]|$)')
+
+@dataclass
+class PaginationModel:
+    """
+    How one site puts the page position into its URLs, learned once from its first few
+    page URLs. Page n carries base + (n - 1) * step: page=1,2,3 is base 1/step 1 and
+    start=0,20,40 is base 0/step 20. "cursor" models recognise opaque tokens but cannot
+    generate URLs or number pages.
+    """
+    location: str  # "query", "path" or "fragment"
+    key: str  # "page=" for parameters, "page/{}"-style shapes for path numbers
+    step: int = 1
+    base: int = 1
+    kind: str = "number"  # "number" or "cursor"
+    template: str = None  # a page URL with "{value}" where the position goes
+    first_url: str = None  # page 1, when it carries no position at all
+
+    def __post_init__(self):
+        self.pattern = _slot_pattern(self.location, self.key)
+
+    @property
+    def can_generate(self) -> bool:
+        return self.kind == "number" and self.template is not None
+
+    def value_of(self, url: str):
+        match = self.pattern.search(url)
+        return match.group(1) if match else None
+
+    def page_number(self, url: str):
+        """
+        The page a URL shows, or None when this model can't tell.
+        """
+        value = self.value_of(url)
+        if value is None:
+            return 1 if self.first_url is not None else None
+        if self.kind != "number" or not value.isdigit():
+            return None
+        return (int(value) - self.base) // self.step + 1
+
+    def page_numbers(self, urls) -> list:
+        return [self.page_number(url) for url in urls]
+
+    def url_for(self, page_number: int) -> str:
+        if not self.can_generate:
+            raise ValueError(f"{self.kind} pagination on '{self.key}' can't generate URLs")
+        if page_number == 1 and self.first_url is not None:
+            return self.first_url
+        return self.template.replace("{value}", str(self.base + (page_number - 1) * self.step))
+
+    def urls_for(self, page_numbers) -> list:
+        return [self.url_for(number) for number in page_numbers]
+
+    @classmethod
+    def learn(cls, urls: list):
+        """
+        Infers the model from consecutive page URLs, in page order (two are usually enough).
+        Returns None when no URL position changes the way pagination does.
+        """
+        urls = [url for url in urls if url]
+        slot_maps = [{(location, key): (value, start, end) for location, key, value, start, end in _pagination_slots(url)}
+                     for url in urls]
+        candidates = []
+        for slot in {slot for slots in slot_maps for slot in slots}:
+            location, key = slot
+            name = key.rstrip("=").lower()
+            values = [slots[slot][0] if slot in slots else None for slots in slot_maps]
+            present = [value for value in values if value is not None]
+            if not present or (len(present) < 2 and len(urls) > 1 and values[0] is not None):
+                continue
+            if len(set(present)) < len(present):
+                continue  # a page position is different on every page
+            # The model uses the most recent URL carrying the slot as its template.
+            index = max(i for i, value in enumerate(values) if value is not None)
+            _, start, end = slot_maps[index][slot]
+            template = urls[index][:start] + "{value}" + urls[index][end:]
+            first_url = urls[0] if values[0] is None else None
+
+            if not all(value.isdigit() for value in present):
+                if key.endswith("=") and (len(present) > 1 or name in CURSOR_PARAM_NAMES):
+                    candidates.append(((2, 0), cls(location, key, kind="cursor", first_url=first_url)))
+                continue
+            numbers = [int(value) for value in present]
+            steps = {b - a for a, b in zip(numbers, numbers[1:])}
+            if len(steps) > 1 or any(step <= 0 for step in steps):
+                continue
+            if steps:
+                step = steps.pop()
+                if len(numbers) == 2 and (name in PAGE_PARAM_NAMES or "page" in name):
+                    step = 1  # page 3 straight after page 1 is a skip, not a step of 2
+            elif name in OFFSET_PARAM_NAMES and first_url is not None:
+                step = numbers[0]  # page 1 has no offset, so page 2's offset is one step
+            elif name in PAGE_PARAM_NAMES or "page" in name or first_url is not None:
+                step = 1
+            else:
+                continue
+            if step == 1 and name not in OFFSET_PARAM_NAMES:
+                base = 1
+            else:
+                base = 0 if first_url is not None else numbers[0] % step
+            known = name in PAGE_PARAM_NAMES or name in OFFSET_PARAM_NAMES or "page" in name
+            rank = (0 if known else 1, ("query", "path", "fragment").index(location))
+            candidates.append((rank, cls(location, key, step, base, template=template, first_url=first_url)))
+        if not candidates:
+            return None
+        return min(candidates, key=lambda candidate: candidate[0])[1]
+
+# Tracks DOM mutations and in-flight fetch/XHR requests in the page, so waits can end as
+# soon as the content stops changing. Installed as an init script and again on demand.
+_SETTLE_TRACKER_BODY = """
+    if (!window.__scraperSettle) {
+        const state = { lastChange: performance.now(), inflight: 0 };
+        window.__scraperSettle = state;
+        const touch = () => { state.lastChange = performance.now(); };
+        new MutationObserver(touch).observe(document, { childList: true, subtree: true, characterData: true });
+        if (window.fetch) {
+            const originalFetch = window.fetch;
+            window.fetch = function (...args) {
+                state.inflight++; touch();
+                return originalFetch.apply(this, args).finally(() => { state.inflight--; touch(); });
+            };
+        }
+        const originalSend = XMLHttpRequest.prototype.send;
+        XMLHttpRequest.prototype.send = function (...args) {
+            state.inflight++; touch();
+            this.addEventListener('loadend', () => { state.inflight--; touch(); }, { once: true });
+            return originalSend.apply(this, args);
+        };
+    }
+"""
+SETTLE_INIT_SCRIPT = "(() => {" + _SETTLE_TRACKER_BODY + "})();"
+SETTLE_WAIT_SCRIPT = "async ([quietMs, timeoutMs]) => {" + _SETTLE_TRACKER_BODY + """
+    const state = window.__scraperSettle;
+    const started = performance.now();
+    return await new Promise(resolve => {
+        const check = () => {
+            const now = performance.now();
+            if (now - started >= timeoutMs) return resolve(false);
+            if (state.inflight <= 0 && now - Math.max(state.lastChange, started) >= quietMs) return resolve(true);
+            setTimeout(check, 50);
+        };
+        check();
+    });
+}"""
+
+async def wait_for_dom_settle(page, quiet_ms: int = 400, timeout_ms: int = 5000) -> bool:
+    """
+    Waits until the DOM has not changed for quiet_ms and no fetch/XHR is in flight,
+    or until timeout_ms passes. Returns True if the page settled before the cap.
+    """
+    try:
+        return await page.evaluate(SETTLE_WAIT_SCRIPT, [quiet_ms, timeout_ms])
+    except Exception:
+        # A navigation during the wait destroys the execution context; nothing left to wait for.
+        return False
+
+LOAD_MORE_SELECTORS = [
+    # TIER 1: HIGH-CONFIDENCE ATTRIBUTE SELECTORS
+    '[data-testid*="load-more" i]', '[data-testid*="show-more" i]',
+    '[data-action*="load-more" i]', '[data-action*="show-more" i]',
+    'button[aria-label*="load more" i]', 'a[aria-label*="load more" i]',
+    'button[aria-label*="show more" i]', 'a[aria-label*="show more" i]',
+    # TIER 2: COMMON TEXT PATTERNS
+    'button:has-text("Show More")', 'button:has-text("Load More")',
+    'button:has-text("See More")', 'button:has-text("View More")',
+    'a:has-text("Show More")', 'a:has-text("Load More")',
+    'a:has-text("See More")', 'a:has-text("View More")',
+    # TIER 3: COMMON CLASS NAME PATTERNS
+    '[class*="load-more" i]', '[class*="show-more" i]',
+    '[class*="see-more" i]', '[class*="view-more" i]',
+    '[class*="loadmore" i]', '[class*="showmore" i]',
+    # TIER 4: GENERIC FALLBACKS
+    'a.more-link', '.more-button'
+]
 
-    # Pattern 3: Look for a number at the very end of the URL path
-    match = re.search(r'/(\d+)/?$', url)
+# Checks a whole list of selectors in one evaluation. Elements are tested the way Playwright
+# would: non-empty box and not visibility:hidden, and ':has-text' is a case-insensitive
+# substring match. The winner is tagged so Python can click it without another search.
+PROBE_SCRIPT = """
+([candidates, requireEnabled, token]) => {
+    document.querySelectorAll(`[data-scraper-probe="${token}"]`)
+        .forEach(el => el.removeAttribute('data-scraper-probe'));
+    const isVisible = el => {
+        const rect = el.getBoundingClientRect();
+        return rect.width > 0 && rect.height > 0 && getComputedStyle(el).visibility !== 'hidden';
+    };
+    const isEnabled = el => !el.disabled && el.getAttribute('aria-disabled') !== 'true';
+    const textOf = el => (el.textContent || '').replace(/\\s+/g, ' ').trim();
+    for (let i = 0; i < candidates.length; i++) {
+        const [css, text] = candidates[i];
+        let elements;
+        try { elements = document.querySelectorAll(css); } catch (e) { continue; }
+        for (const el of elements) {
+            if (text && !textOf(el).toLowerCase().includes(text.toLowerCase())) continue;
+            if (!isVisible(el) || (requireEnabled && !isEnabled(el))) continue;
+            el.setAttribute('data-scraper-probe', token);
+            return { index: i, text: textOf(el).slice(0, 80) };
+        }
+    }
+    return null;
+}
+"""
+
+@lru_cache(maxsize=None)
+def _probe_candidate(selector: str) -> tuple:
+    """
+    Splits a Playwright selector into plain CSS and an optional ':has-text' needle.
+    """
+    match = re.fullmatch(r'(.*):has-text\("(.*)"\)', selector)
     if match:
-        return int(match.group(1))
-    
-    return 1
+        return match.group(1), match.group(2)
+    return selector, ""
+
+def probed_selectors(selectors: list, match) -> list:
+    """
+    The selectors a probe actually tested: it stops at the first match.
+    """
+    return selectors[:selectors.index(match[0]) + 1] if match else list(selectors)
 
-async def handle_dynamic_content_loading(page):
+async def probe_selectors(page, selectors: list, require_enabled: bool = False, token: str = "probe"):
+    """
+    Finds the first selector with a visible (and, if asked, enabled) match in a single
+    round trip. Returns (selector, locator, text) or None.
+    """
+    result = await page.evaluate(
+        PROBE_SCRIPT, [[_probe_candidate(selector) for selector in selectors], require_enabled, token])
+    if not result:
+        return None
+    locator = page.locator(f'[data-scraper-probe="{token}"]')
+    return selectors[result["index"]], locator, result["text"]
+
+NEXT_BUTTON_SELECTORS = [
+    'a[rel="next"]', 'button[rel="next"]',
+    'nav[aria-label*="pagination" i] a:has-text("Next")',
+    'nav[aria-label*="pagination" i] button:has-text("Next")',
+    'li.pagination-item--next a', '.pagination a:has-text("Next")',
+    '.pagination button:has-text("Next")', 'button:has-text("Next")',
+    'a[aria-label*="next" i]', 'button[aria-label*="next" i]',
+    'a[title*="next" i]', 'button[title*="next" i]'
+]
+
+async def find_next_button(page, job: CrawlJob = None):
+    """
+    Returns a locator for the first visible and enabled 'Next' control, or None.
+    All selectors are checked at once in the page; if none matches, the page gets one
+    short settle window to render late controls before pagination is declared over.
+    With a job, the host's known-good selectors come first and the outcome is recorded.
+    """
+    cache = job.selector_cache if job is not None else None
+    tracer = job.tracer if job is not None else PhaseTracer()
+    host = urlsplit(page.url).hostname
+    selectors = cache.ordered(host, "next", NEXT_BUTTON_SELECTORS) if cache else NEXT_BUTTON_SELECTORS
+    match = None
+    with tracer.phase("next_button", page.url) as event:
+        for attempt in range(2):
+            if attempt:
+                await wait_for_dom_settle(page, quiet_ms=300, timeout_ms=2000)
+            try:
+                match = await probe_selectors(page, selectors, require_enabled=True, token="next")
+            except Exception:
+                match = None
+            if match is not None:
+                break
+        event["selector"] = match[0] if match else None
+    if cache:
+        outcome = cache.record(host, "next", match[0] if match else None, probed_selectors(selectors, match))
+        job.metrics.inc("scraper_selector_lookups_total", kind="next", result=outcome)
+    if match is None:
+        return None
+    selector, next_button, _ = match
+    print(f"Found 'Next' button with selector: '{selector}'")
+    return next_button
+
+API_RECORD_ROUNDS = 2
+API_DONE_FLAGS = {"has_next": False, "hasnext": False, "has_more": False, "hasmore": False,
+                  "more": False, "is_last": True, "islast": True, "last": True}
+API_CACHE_BUSTER_PARAMS = {"_", "t", "ts", "timestamp", "time", "cb", "cachebuster", "nocache", "rnd", "rand",
+                           "random", "v", "ver"}
+
+class ApiRecorder:
+    """
+    Records the JSON bodies of GET fetch/XHR responses a page receives while it is attached.
+    """
+    def __init__(self, page):
+        self.page = page
+        self.records = []  # (url, payload) in arrival order
+        self._pending = set()
+        page.on("response", self._on_response)
+
+    def _on_response(self, response):
+        request = response.request
+        if request.resource_type not in ("xhr", "fetch") or request.method != "GET":
+            return
+        if "json" not in response.headers.get("content-type", ""):
+            return
+        task = asyncio.ensure_future(self._read(response))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _read(self, response):
+        try:
+            self.records.append((response.url, await response.json()))
+        except Exception:
+            pass
+
+    async def stop(self) -> list:
+        self.page.remove_listener("response", self._on_response)
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+        return self.records
+
+@dataclass
+class ApiPagination:
+    """
+    How a JSON endpoint pages: a query parameter that is a page number, an offset that
+    grows by `step`, or a cursor copied from the previous payload at `cursor_path`.
+    """
+    url: str  # the last recorded request
+    param: str
+    kind: str  # "page", "offset" or "cursor"
+    step: int = 1
+    cursor_path: tuple = ()
+    items_path: tuple = None  # where the item list sits in a payload; None means search for it
+
+def _query_params(url: str) -> dict:
+    return dict(parse_qsl(urlsplit(url).query, keep_blank_values=True))
+
+def _with_query_param(url: str, name: str, value) -> str:
+    parts = urlsplit(url)
+    params = parse_qsl(parts.query, keep_blank_values=True)
+    params = [(key, str(value) if key == name else old) for key, old in params]
+    if name not in dict(params):
+        params.append((name, str(value)))
+    return urlunsplit(parts._replace(query=urlencode(params)))
+
+def _json_path_to(payload, value, depth: int = 4):
+    """
+    Returns the key path at which `value` sits in a JSON payload, or None.
+    """
+    if payload == value:
+        return ()
+    if depth == 0:
+        return None
+    children = payload.items() if isinstance(payload, dict) else enumerate(payload) if isinstance(payload, list) else ()
+    for key, child in children:
+        path = _json_path_to(child, value, depth - 1)
+        if path is not None:
+            return (key,) + path
+    return None
+
+def _json_at(payload, path: tuple):
+    for key in path:
+        try:
+            payload = payload[key]
+        except (KeyError, IndexError, TypeError):
+            return None
+    return payload
+
+def _items_path(payload, depth: int = 3):
+    """
+    Returns the key path of the longest list in a payload (the payload itself if it is
+    a list), looking into nested objects such as {"data": {"items": [...]}}. None if there is no list.
+    """
+    if isinstance(payload, list):
+        return ()
+    best, best_length = None, -1
+    if isinstance(payload, dict) and depth > 0:
+        for key, value in payload.items():
+            path = (key,) if isinstance(value, list) else None
+            if path is None and isinstance(value, dict):
+                child = _items_path(value, depth - 1)
+                path = (key,) + child if child is not None else None
+            if path is not None and len(_json_at(payload, path)) > best_length:
+                best, best_length = path, len(_json_at(payload, path))
+    return best
+
+def _payload_items(payload, items_path: tuple = None) -> list:
+    """
+    Returns the item list of a payload, at `items_path` when it is known.
+    """
+    path = items_path if items_path is not None else _items_path(payload)
+    items = _json_at(payload, path) if path is not None else None
+    return items if isinstance(items, list) else []
+
+def _payload_says_done(payload, items_path: tuple = None) -> bool:
+    # Flags like has_more sit at the top or next to the item list.
+    path = items_path if items_path is not None else _items_path(payload) or ()
+    for depth in range(len(path) + 1):
+        container = _json_at(payload, path[:depth])
+        if not isinstance(container, dict):
+            continue
+        for key, value in container.items():
+            done_value = API_DONE_FLAGS.get(key.lower())
+            if done_value is not None and value is done_value:
+                return True
+    return not _payload_items(payload, items_path)
+
+def _looks_like_timestamp(value: str) -> bool:
+    return value.isdigit() and len(value) >= 9  # epoch seconds or milliseconds
+
+def infer_api_pagination(records: list):
+    """
+    Works out how the recorded JSON endpoint pages, from the requests one or two scroll or
+    click rounds produced. Returns an ApiPagination or None.
+    """
+    endpoints = {}
+    for url, payload in records:
+        parts = urlsplit(url)
+        endpoints.setdefault((parts.netloc, parts.path), []).append((url, payload))
+
+    for entries in sorted(endpoints.values(), key=len, reverse=True):
+        last_url, last_payload = entries[-1]
+        items_path = _items_path(last_payload)
+        last_params = _query_params(last_url)
+        # Pagination vocabulary first, so ?ts=1&page=2 -> ?ts=2&page=3 pages on 'page'.
+        names = sorted(last_params, key=lambda name: name.lower() not in PAGE_PARAM_NAMES | OFFSET_PARAM_NAMES)
+        names = [name for name in names if name.lower() not in API_CACHE_BUSTER_PARAMS
+                 and not _looks_like_timestamp(last_params[name])]
+        if len(entries) >= 2:
+            previous_url, previous_payload = entries[-2]
+            previous_params = _query_params(previous_url)
+            for name in names:
+                value, old_value = last_params[name], previous_params.get(name)
+                if old_value == value:
+                    continue
+                if old_value and value.isdigit() and old_value.isdigit() and int(value) > int(old_value):
+                    step = int(value) - int(old_value)
+                    kind = "offset" if name.lower() in OFFSET_PARAM_NAMES or step > 1 else "page"
+                    return ApiPagination(last_url, name, kind, step, items_path=items_path)
+            for name in names:
+                value = last_params[name]
+                if value == previous_params.get(name):
+                    continue
+                cursor_path = _json_path_to(previous_payload, value) if value else None
+                if cursor_path is not None:
+                    return ApiPagination(last_url, name, "cursor", cursor_path=cursor_path, items_path=items_path)
+        # A single request can still be paged if its parameter names make the scheme obvious.
+        for name in names:
+            value = last_params[name]
+            if value.isdigit() and name.lower() in PAGE_PARAM_NAMES:
+                return ApiPagination(last_url, name, "page", 1, items_path=items_path)
+            if value.isdigit() and name.lower() in OFFSET_PARAM_NAMES:
+                step = len(_payload_items(last_payload, items_path))
+                if step:
+                    return ApiPagination(last_url, name, "offset", step, items_path=items_path)
+    return None
+
+async def replay_api_pagination(context, pagination: ApiPagination, last_payload, job: CrawlJob) -> int:
+    """
+    Calls the endpoint directly with the context's request client, page after page, and
+    streams each JSON payload to the job's sink. Returns the number of requests made.
+    """
+    url, payload, requests_made = pagination.url, last_payload, 0
+    while requests_made < job.api_max_requests and not _payload_says_done(payload, pagination.items_path):
+        if pagination.kind == "cursor":
+            cursor = _json_at(payload, pagination.cursor_path)
+            if cursor in (None, ""):
+                break
+            url = _with_query_param(url, pagination.param, cursor)
+        else:
+            current = int(_query_params(url).get(pagination.param, 0))
+            url = _with_query_param(url, pagination.param, current + pagination.step)
+        try:
+            await throttle(job, url)
+            response = await context.request.get(url, timeout=30000)
+            if not response.ok:
+                print(f"-> API returned HTTP {response.status} for {url}; stopping replay.")
+                break
+            payload = await response.json()
+        except Exception as e:
+            print(f"[!] API request {url} failed: {e!r}")
+            break
+        requests_made += 1
+        await job.sink.put(url, json.dumps(payload), media="json", kind="api")
+    return requests_made
+
+async def replay_recorded_api(page, recorder: ApiRecorder, job: CrawlJob) -> bool:
+    """
+    Stops recording and, if a pageable endpoint was seen, stores what was recorded and pages
+    through the rest of it directly. Returns True when the DOM no longer needs scrolling,
+    i.e. only when the API was actually paged.
+    """
+    records = await recorder.stop()
+    pagination = infer_api_pagination(records)
+    if pagination is None:
+        print(f"-> No pageable JSON API among {len(records)} recorded responses; continuing in the DOM.")
+        return False
+    print(f"-> Found {pagination.kind} pagination on '{pagination.param}' at {pagination.url}. Replaying the API directly.")
+    endpoint = urlsplit(pagination.url)[1:3]
+    recorded = [(url, payload) for url, payload in records if urlsplit(url)[1:3] == endpoint]
+    for url, payload in recorded:
+        await job.sink.put(url, json.dumps(payload), media="json", kind="api")
+    requests_made = await replay_api_pagination(page.context, pagination, recorded[-1][1], job)
+    print(f"-> Stored {len(recorded) + requests_made} API payloads for {page.url}.")
+    if not requests_made:
+        print("-> The API replay made no requests; continuing in the DOM.")
+        return False
+    return True
+
+HARVEST_KEEP_LAST = 20
+
+# Serializes item nodes not seen before and tags them as harvested. With eviction, all but
+# the newest `keepLast` harvested items are removed and replaced by a spacer of the same
+# height, so the scroll position and infinite-scroll triggers keep working.
+HARVEST_SCRIPT = """
+([selector, evict, keepLast]) => {
+    const items = [];
+    for (const el of document.querySelectorAll(selector)) {
+        if (el.hasAttribute('data-scraper-harvested')) continue;
+        items.push(el.outerHTML);
+        el.setAttribute('data-scraper-harvested', '');
+    }
+    if (evict) {
+        const harvested = Array.from(document.querySelectorAll(selector))
+            .filter(el => el.hasAttribute('data-scraper-harvested'));
+        for (const el of harvested.slice(0, Math.max(0, harvested.length - keepLast))) {
+            const parent = el.parentNode;
+            let spacer = parent.querySelector(':scope > [data-scraper-spacer]');
+            if (!spacer) {
+                spacer = document.createElement('div');
+                spacer.setAttribute('data-scraper-spacer', '');
+                spacer.dataset.height = '0';
+                parent.insertBefore(spacer, parent.firstChild);
+            }
+            const height = Number(spacer.dataset.height) + el.getBoundingClientRect().height;
+            spacer.dataset.height = String(height);
+            spacer.style.height = `${height}px`;
+            el.remove();
+        }
+    }
+    return items;
+}
+"""
+
+async def harvest_new_items(page, job: CrawlJob, batch: int) -> int:
+    """
+    Streams feed items added since the last call to the job's sink as one JSON batch.
+    Returns the number of items harvested.
+    """
+    try:
+        items = await page.evaluate(HARVEST_SCRIPT, [job.harvest_selector, job.evict_harvested, HARVEST_KEEP_LAST])
+    except Exception as e:
+        print(f"[!] Harvesting '{job.harvest_selector}' failed: {e!r}")
+        return 0
+    if items:
+        batch_url = f"{page.url}#harvest-{batch}"
+        await job.sink.put(batch_url, json.dumps({"url": page.url, "batch": batch, "items": items}),
+                           media="json", kind="harvest")
+        print(f"-> Harvested {len(items)} new items (batch {batch}).")
+    return len(items)
+
+class LoadBudget:
+    """
+    Tracks one page's dynamic-loading budgets: wall time, rounds, DOM node count and
+    JS heap. Node count and heap come from CDP Performance metrics, read only when
+    one of those budgets is set.
+    """
+    def __init__(self, page, job: CrawlJob):
+        self.page = page
+        self.job = job
+        self.started = time.monotonic()
+        self._cdp = None
+
+    async def exceeded(self, rounds: int):
+        """
+        Returns the name of the first budget that has run out, or None.
+        """
+        job = self.job
+        if job.max_load_seconds and time.monotonic() - self.started >= job.max_load_seconds:
+            return f"wall_time ({job.max_load_seconds:g}s)"
+        if job.max_load_rounds and rounds >= job.max_load_rounds:
+            return f"rounds ({job.max_load_rounds})"
+        if not (job.max_dom_nodes or job.max_js_heap_mb):
+            return None
+        try:
+            if self._cdp is None:
+                self._cdp = await self.page.context.new_cdp_session(self.page)
+                await self._cdp.send("Performance.enable")
+            response = await self._cdp.send("Performance.getMetrics")
+        except Exception as e:
+            print(f"[!] Could not read page metrics: {e!r}")
+            return None
+        metrics = {metric["name"]: metric["value"] for metric in response.get("metrics", [])}
+        if job.max_dom_nodes and metrics.get("Nodes", 0) >= job.max_dom_nodes:
+            return f"dom_nodes ({int(metrics['Nodes'])} >= {job.max_dom_nodes})"
+        heap_mb = metrics.get("JSHeapUsedSize", 0) / (1024 * 1024)
+        if job.max_js_heap_mb and heap_mb >= job.max_js_heap_mb:
+            return f"js_heap ({heap_mb:.0f} MB >= {job.max_js_heap_mb:g} MB)"
+        return None
+
+    async def close(self):
+        if self._cdp is not None:
+            try:
+                await self._cdp.detach()
+            except Exception:
+                pass
+
+async def handle_dynamic_content_loading(page, job: CrawlJob = None):
     """
     Handles 'See More' buttons and basic 'infinite scroll' by scrolling and clicking.
+    In API replay mode, the first rounds are recorded and, if they reveal a paged JSON
+    endpoint, the rest is fetched from that endpoint instead of the DOM.
+    With a harvest selector, new items are streamed out before every round.
+    Stops early, keeping what is loaded, when one of the job's load budgets runs out.
+    Returns why loading stopped: "done", "api_replay" or "budget:<which>".
     """
-    see_more_selectors = [
-        # TIER 1: HIGH-CONFIDENCE ATTRIBUTE SELECTORS
-        '[data-testid*="load-more" i]', '[data-testid*="show-more" i]',
-        '[data-action*="load-more" i]', '[data-action*="show-more" i]',
-        'button[aria-label*="load more" i]', 'a[aria-label*="load more" i]',
-        'button[aria-label*="show more" i]', 'a[aria-label*="show more" i]',
-        # TIER 2: COMMON TEXT PATTERNS
-        'button:has-text("Show More")', 'button:has-text("Load More")',
-        'button:has-text("See More")', 'button:has-text("View More")',
-        'a:has-text("Show More")', 'a:has-text("Load More")',
-        'a:has-text("See More")', 'a:has-text("View More")',
-        # TIER 3: COMMON CLASS NAME PATTERNS
-        '[class*="load-more" i]', '[class*="show-more" i]',
-        '[class*="see-more" i]', '[class*="view-more" i]',
-        '[class*="loadmore" i]', '[class*="showmore" i]',
-        # TIER 4: GENERIC FALLBACKS
-        'a.more-link', '.more-button'
-    ]
-    
+    cache = job.selector_cache if job is not None else None
+    recorder = ApiRecorder(page) if job is not None and job.api_replay else None
+    harvesting = job is not None and bool(job.harvest_selector)
+    budget = LoadBudget(page, job) if job is not None else None
+    tracer = job.tracer if job is not None else PhaseTracer()
+    host = urlsplit(page.url).hostname
+    rounds = 0
+    harvest_batch = 0  # separate from rounds: the final harvest after a break needs its own number
+    stop_reason = "done"
+    load_more_match = load_more_tried = None
+    loading_started = time.perf_counter()
     while True:
+        if harvesting and await harvest_new_items(page, job, harvest_batch):
+            harvest_batch += 1
         clicked_or_scrolled = False
+        round_started = time.perf_counter()
         # STRATEGY 1: CLICK 'SEE MORE' BUTTONS
-        for selector in see_more_selectors:
+        # All selectors are checked in one in-page pass instead of one round trip each,
+        # with the host's known-good selectors first.
+        selectors = cache.ordered(host, "load_more", LOAD_MORE_SELECTORS) if cache else LOAD_MORE_SELECTORS
+        try:
+            match = await probe_selectors(page, selectors, token="load-more")
+        except Exception:
+            match = None
+        if cache and load_more_match is None:
+            # Recorded once per page below: the final no-button probe of a page whose
+            # button already worked is not a miss.
+            load_more_match, load_more_tried = match, probed_selectors(selectors, match)
+        if match is not None:
+            _, see_more_button, button_text = match
             try:
-                see_more_button = page.locator(selector).first
-                if await see_more_button.is_visible():
-                    print(f"-> Found and clicking a '{await see_more_button.text_content()}' button.")
-                    await see_more_button.click()
-                    # CRITICAL FIX: Wait for content to load, don't re-navigate the page.
-                    await page.wait_for_load_state('networkidle', timeout=10000)
-                    clicked_or_scrolled = True
-                    break 
+                print(f"-> Found and clicking a '{button_text}' button.")
+                if job is not None:
+                    await throttle(job, page.url)
+                await see_more_button.click()
+                # CRITICAL FIX: Wait for content to load, don't re-navigate the page.
+                await wait_for_dom_settle(page, timeout_ms=10000)
+                clicked_or_scrolled = True
             except Exception:
-                continue
-        
-        if clicked_or_scrolled:
-            await asyncio.sleep(random.uniform(1.0, 2.5))
-            continue
+                pass
+            tracer.record("click_round", page.url, time.perf_counter() - round_started,
+                          selector=match[0], clicked=clicked_or_scrolled)
 
         # STRATEGY 2: HANDLE INFINITE SCROLL
-        initial_height = await page.evaluate('document.body.scrollHeight')
-        await page.evaluate('window.scrollTo(0, document.body.scrollHeight)')
-        try:
-            await page.wait_for_load_state('networkidle', timeout=5000)
-        except TimeoutError:
-            # This is okay, it just means scrolling didn't trigger network activity
-            pass
-        await asyncio.sleep(2)
-        new_height = await page.evaluate('document.body.scrollHeight')
+        if not clicked_or_scrolled:
+            initial_height = await page.evaluate('document.body.scrollHeight')
+            await page.evaluate('window.scrollTo(0, document.body.scrollHeight)')
+            # Returns shortly after the DOM goes quiet; a scroll that loads nothing costs one quiet window.
+            await wait_for_dom_settle(page)
+            new_height = await page.evaluate('document.body.scrollHeight')
 
-        if new_height > initial_height:
-            print(f"-> Scrolled down to load more content (height changed from {initial_height} to {new_height}).")
-            clicked_or_scrolled = True
+            if new_height > initial_height:
+                print(f"-> Scrolled down to load more content (height changed from {initial_height} to {new_height}).")
+                clicked_or_scrolled = True
+            tracer.record("scroll_round", page.url, time.perf_counter() - round_started,
+                          grew=clicked_or_scrolled, height=new_height)
         
         if not clicked_or_scrolled:
             print("-> No more dynamic content buttons or scroll-to-load content found.")
             break
 
-async def scrape_with_playwright(start_url: str, existing_visited_urls: set, scraped_data: dict):
+        rounds += 1
+        if recorder is not None and rounds >= API_RECORD_ROUNDS:
+            if await replay_recorded_api(page, recorder, job):
+                stop_reason = "api_replay"
+                break
+            recorder = None
+
+        exceeded = await budget.exceeded(rounds) if budget is not None else None
+        if exceeded:
+            print(f"-> Load budget reached: {exceeded}. Keeping the content loaded so far.")
+            stop_reason = f"budget:{exceeded.split()[0]}"
+            break
+
+    if cache and load_more_tried is not None:
+        outcome = cache.record(host, "load_more", load_more_match[0] if load_more_match else None, load_more_tried)
+        job.metrics.inc("scraper_selector_lookups_total", kind="load_more", result=outcome)
+    if recorder is not None:
+        await recorder.stop()
+    if budget is not None:
+        await budget.close()
+    if harvesting:
+        await harvest_new_items(page, job, harvest_batch)
+    tracer.record("dynamic_loading", page.url, time.perf_counter() - loading_started,
+                  rounds=rounds, stop=stop_reason)
+    return stop_reason
+
+# The same schema extract_records() applies with lxml, evaluated in the page in one round trip.
+EXTRACT_SCRIPT = """
+async ([schema, withHash]) => {
+    const select = (root, selector) => {
+        if (!selector) return [root];
+        const isXPath = selector.startsWith('xpath:') || /^(\\/|\\.\\/|\\()/.test(selector);
+        if (!isXPath) return Array.from(root.querySelectorAll(selector));
+        const expression = selector.startsWith('xpath:') ? selector.slice(6) : selector;
+        const result = document.evaluate(expression, root, null, XPathResult.ANY_TYPE, null);
+        if (result.resultType === XPathResult.STRING_TYPE) return [result.stringValue];
+        if (result.resultType === XPathResult.NUMBER_TYPE) return [String(result.numberValue)];
+        if (result.resultType === XPathResult.BOOLEAN_TYPE) return [String(result.booleanValue)];
+        const nodes = [];
+        for (let node = result.iterateNext(); node; node = result.iterateNext()) nodes.push(node);
+        return nodes;
+    };
+    const fieldValue = (node, spec) => {
+        if (typeof spec === 'string') spec = {selector: spec};
+        const values = [];
+        for (const match of select(node, spec.selector)) {
+            let value;
+            if (typeof match === 'string') value = match;
+            else if (match.nodeType !== Node.ELEMENT_NODE) value = match.nodeValue;
+            else if (spec.attr) {
+                value = match.getAttribute(spec.attr);
+                if (value !== null && (spec.attr === 'href' || spec.attr === 'src')) value = new URL(value, location.href).href;
+            } else value = match.textContent.split(/\\s+/).filter(Boolean).join(' ');
+            if (value !== null && value !== undefined) values.push(value);
+            if (values.length && !spec.all) break;
+        }
+        return spec.all ? values : (values.length ? values[0] : null);
+    };
+    const items = schema.items ? select(document, schema.items) : [document.documentElement];
+    const records = items.map(item => {
+        const record = {};
+        for (const [name, spec] of Object.entries(schema.fields || {})) record[name] = fieldValue(item, spec);
+        record._url = location.href;
+        return record;
+    });
+    let hash = null;
+    if (withHash) {
+        const html = new TextEncoder().encode(document.documentElement.outerHTML);
+        if (crypto.subtle) {
+            const digest = new Uint8Array(await crypto.subtle.digest('SHA-256', html));
+            hash = 'sha256:' + Array.from(digest, b => b.toString(16).padStart(2, '0')).join('');
+        } else {  // crypto.subtle only exists in secure contexts
+            let h = 0x811c9dc5;
+            for (const b of html) h = Math.imul(h ^ b, 0x01000193) >>> 0;
+            hash = 'fnv1a32:' + h.toString(16).padStart(8, '0');
+        }
+    }
+    return {records, hash};
+}
+"""
+
+@dataclass
+class ExtractedPage:
+    """
+    What in-browser extraction keeps of a page: its records and, optionally, a content hash.
+    """
+    records: list
+    content_hash: str = None
+
+async def extract_in_page(page, job: CrawlJob) -> ExtractedPage:
+    with job.tracer.phase("extract", page.url) as event:
+        result = await page.evaluate(EXTRACT_SCRIPT, [job.schema, job.page_hash])
+        event["records"] = len(result["records"])
+    return ExtractedPage(result["records"], result["hash"])
+
+async def throttle(job: CrawlJob, url: str):
+    with job.tracer.phase("rate_limit", url) as event:
+        event["waited"] = round(await job.rate_limiter.wait(url), 3)
+
+async def traced_goto(page, url: str, job: CrawlJob, **kwargs):
+    await throttle(job, url)
+    with job.tracer.phase("goto", url) as event:
+        response = await page.goto(url, **kwargs)
+        if response is not None:
+            event["status"] = response.status
+            event["bytes"] = int(response.headers.get("content-length") or 0)
+    return response
+
+async def capture_html(page, job: CrawlJob):
+    """
+    Returns the rendered HTML, or an ExtractedPage when the job extracts in the browser.
+    """
+    if job.extract_in_browser and job.schema:
+        return await extract_in_page(page, job)
+    with job.tracer.phase("content", page.url) as event:
+        html = await page.content()
+        event["bytes"] = len(html.encode("utf-8"))
+    return html
+
+async def store_page(job: CrawlJob, url: str, html):
+    if isinstance(html, ExtractedPage):
+        # Only the records are kept; the index entry still marks the URL as done for --resume.
+        await job.sink.put(url, json.dumps({"url": url, "hash": html.content_hash, "records": html.records}),
+                           media="json")
+        if job.extractor is not None:
+            await job.extractor.write_records(url, html.records)
+    else:
+        await job.sink.put(url, html)
+        if job.extractor is not None:
+            await job.extractor.submit(url, html)
+    job.visited_urls.add(url)
+    job.metrics.inc("scraper_pages_captured_total", host=urlsplit(url).hostname)
+
+def page_limit_reached(job: CrawlJob) -> bool:
+    return bool(job.max_pages) and len(job.visited_urls) >= job.max_pages
+
+class _NextLinkParser(HTMLParser):
+    """
+    Collects hrefs that point to the next page: rel="next" links, and anchors whose
+    aria-label, title or leading text says "next".
     """
-    Scrapes a site and populates the scraped_data dictionary with final page HTML.
+    def __init__(self):
+        super().__init__()
+        self.hrefs = []
+        self._open_anchor_href = None
+        self._anchor_text = ""
+
+    def handle_starttag(self, tag, attrs):
+        attrs = {name: value or "" for name, value in attrs}
+        href = attrs.get("href")
+        if tag not in ("a", "link") or not href:
+            return
+        labels = (attrs.get("aria-label", "") + " " + attrs.get("title", "")).lower()
+        if "next" in attrs.get("rel", "").lower().split() or "next" in labels:
+            self.hrefs.append(href)
+        elif tag == "a":
+            self._open_anchor_href, self._anchor_text = href, ""
+
+    def handle_data(self, data):
+        if self._open_anchor_href is not None:
+            self._anchor_text += data
+
+    def handle_endtag(self, tag):
+        if tag == "a" and self._open_anchor_href is not None:
+            if self._anchor_text.strip().lower().startswith("next"):
+                self.hrefs.append(self._open_anchor_href)
+            self._open_anchor_href = None
+
+def find_next_link(html: str, base_url: str):
+    """
+    Returns the absolute URL of the next page linked from static HTML, or None.
+    """
+    parser = _NextLinkParser()
+    try:
+        parser.feed(html)
+    except Exception:
+        return None
+    for href in parser.hrefs:
+        if href.startswith("#") or href.lower().startswith("javascript:"):
+            continue
+        return urljoin(base_url, href)
+    return None
+
+class HttpFirstEngine:
+    """
+    Fetches pages with the context's pooled HTTP client and decides whether the static
+    HTML is complete. Hosts whose pages need JavaScript are remembered, so later pages
+    and jobs on that host go straight to the browser.
+    """
+    DYNAMIC_MARKERS = re.compile(
+        r'load[-_ ]?more|show[-_ ]?more|see[-_ ]?more|view[-_ ]?more|infinite[-_ ]?scroll', re.I)
+    NOSCRIPT_WARNING = re.compile(r'<noscript\b[^>]*>[^<]*(?:enable|requires?) javascript', re.I)
+    MIN_VISIBLE_WORDS = 30
+
+    def __init__(self):
+        self.host_modes = {}  # host -> "http" or "browser"
+        self.http_pages = 0
+        self.escalations = 0
+
+    def mode_for(self, url: str):
+        return self.host_modes.get(urlsplit(url).hostname)
+
+    def incomplete_reason(self, html: str, expect_markers: list = ()):
+        """
+        Returns None when the HTML can be kept as is, otherwise why it needs a browser.
+        """
+        missing = [marker for marker in expect_markers if marker not in html]
+        if missing:
+            return f"missing expected marker {missing[0]!r}"
+        if self.NOSCRIPT_WARNING.search(html):
+            return "page asks for JavaScript"
+        match = self.DYNAMIC_MARKERS.search(html)
+        if match:
+            return f"dynamic loading marker {match.group(0)!r}"
+        visible_text = re.sub(r'<(script|style)\b.*?</\1>|<[^>]+>', ' ', html, flags=re.S | re.I)
+        if len(visible_text.split()) < self.MIN_VISIBLE_WORDS:
+            return "almost no server-rendered text"
+        return None
+
+async def scrape_over_http(start_url: str, job: CrawlJob, context):
+    """
+    Follows 'next' links over plain HTTP for as long as pages come back complete.
+    Returns None when the listing is done, or the URL the browser should take over from:
+    a page that needs rendering, an HTTP error, or a page with no static 'next' link
+    (the browser then checks for a JavaScript 'Next' control before ending the crawl).
+    A page is only stored here once its static 'next' link shows it is server-rendered;
+    the handover URL itself is left for the browser to capture.
+    """
+    engine = job.http_engine
+    host = urlsplit(start_url).hostname
+    print(f"\n--- Starting HTTP session at: {start_url} ---")
+    url = start_url
+    while True:
+        try:
+            await throttle(job, url)
+            with job.tracer.phase("http_fetch", url) as event:
+                response = await context.request.get(url, timeout=30000)
+                html = await response.text() if response.ok else ""
+                event["status"] = response.status
+                event["bytes"] = len(html.encode("utf-8"))
+        except Exception as e:
+            print(f"[!] HTTP fetch of {url} failed: {e!r}. Handing over to the browser.")
+            return url
+        if not response.ok or "html" not in response.headers.get("content-type", ""):
+            print(f"-> HTTP {response.status} for {url}. Handing over to the browser.")
+            return url
+        reason = engine.incomplete_reason(html, job.expect_markers)
+        if reason:
+            print(f"-> {url} needs a browser ({reason}). Using Playwright for {host} from now on.")
+            engine.host_modes[host] = "browser"
+            engine.escalations += 1
+            return url
+        engine.host_modes[host] = "http"
+        engine.http_pages += 1
+
+        url = response.url
+        next_url = find_next_link(html, url)
+        if next_url is None or next_url == url:
+            # A page without a static 'next' link may be a shell whose listing and 'Next'
+            # control are both rendered by script, so the browser captures it instead.
+            print(f"-> No static 'next' link on {url}. Handing over to the browser.")
+            return url
+        if url not in job.visited_urls:
+            print(f"Scraped over HTTP: {url}")
+            await store_page(job, url, html)
+        if page_limit_reached(job):
+            return None
+        if next_url in job.visited_urls:
+            return url
+        await job.sink.record_cursor(next_url)
+        url = next_url
+
+@dataclass
+class CrawlFailure:
+    """
+    Why a browser session ended early, and where the next attempt should pick up.
+    `kind` is one of "transient", "throttled", "terminal", "selector_drift" or "crash".
+    """
+    kind: str
+    url: str
+    detail: str = ""
+    retry_after: float = None  # seconds the site asked us to wait (Retry-After)
+
+_CRASH_MARKERS = ("target closed", "has been closed", "crashed", "browser closed", "connection closed")
+
+def classify_error(error: Exception) -> str:
+    """
+    A dead page or browser is a crash; timeouts, network errors and anything else are
+    transient and get the bounded, backed-off retry path.
+    """
+    message = str(error).lower()
+    return "crash" if any(marker in message for marker in _CRASH_MARKERS) else "transient"
+
+def classify_response(response):
+    """
+    Returns (kind, retry_after) for an HTTP error response, or (None, None) when it is fine.
+    """
+    if response is None or response.status < 400:
+        return None, None
+    if response.status in (429, 503):
+        retry_after = response.headers.get("retry-after", "")
+        return "throttled", float(retry_after) if retry_after.strip().isdigit() else None
+    if response.status in (404, 410):
+        return "terminal", None
+    return "transient", None
+
+async def click_next(page, next_button, job: CrawlJob, timeout: int):
+    """
+    Waits for the host's rate limiter, clicks 'Next' and waits for the URL to change.
+    Returns the main-frame navigation response, or None when the site only changed the
+    URL from script (pushState) and nothing was loaded.
+    """
+    current_url = page.url
+    responses = []
+
+    def on_response(response):
+        if response.request.is_navigation_request() and response.frame == page.main_frame:
+            responses.append(response)
+
+    await throttle(job, current_url)
+    page.on("response", on_response)
+    try:
+        with job.tracer.phase("click", current_url):
+            await next_button.click(timeout=timeout)
+        with job.tracer.phase("wait_for_url", current_url):
+            await page.wait_for_url(lambda url: url != current_url, timeout=timeout)
+    finally:
+        page.remove_listener("response", on_response)
+    return responses[-1] if responses else None
+
+MAX_SKIP_RECOVERIES = 3  # in-session attempts at one skipped page before falling back to a restart
+
+async def recover_skipped_page(page, job: CrawlJob, previous_url: str, missing_number: int, timeout: int) -> bool:
+    """
+    Brings the live session to the page 'Next' jumped over: straight to its URL when the
+    pagination model can generate it, otherwise back to the previous page and one more click.
+    Returns False when neither worked; a closed or crashed page raises instead.
+    """
+    model = job.pagination
+    with job.tracer.phase("skip_recovery", page.url) as event:
+        if model is not None and model.can_generate:
+            event["method"] = "navigate"
+            response = await traced_goto(page, model.url_for(missing_number), job, timeout=60000, wait_until='load')
+            if response is not None and response.status < 400 and model.page_number(page.url) == missing_number:
+                job.metrics.inc("scraper_skip_recoveries_total", method="navigate")
+                return True
+
+        event["method"] = "reclick"
+        if page.url != previous_url:
+            await page.go_back(timeout=timeout, wait_until='load')
+            if page.url != previous_url:
+                await traced_goto(page, previous_url, job, timeout=60000, wait_until='load')
+        await wait_for_dom_settle(page)
+        next_button = await find_next_button(page, job)
+        if next_button is None:
+            return False
+        await click_next(page, next_button, job, timeout)
+        number = model.page_number(page.url) if model is not None else get_page_number(page.url)
+        if number == missing_number:
+            job.metrics.inc("scraper_skip_recoveries_total", method="reclick")
+            return True
+    return False
+
+async def capture_numbered_page(context, url: str, page_number: int, job: CrawlJob):
+    """
+    Loads one page-N URL in its own tab. Returns (html, has_next); html is None when the
+    site answered 404/410 or redirected away from page N, i.e. N is past the end. A
+    throttled or failing response comes back as a CrawlFailure instead.
+    """
+    tab = await context.new_page()
+    try:
+        response = await traced_goto(tab, url, job, timeout=60000, wait_until='load')
+        kind, retry_after = classify_response(response)
+        if kind in ("throttled", "transient"):
+            return CrawlFailure(kind, url, f"HTTP {response.status}", retry_after)
+        if response is None or kind == "terminal" or job.pagination.page_number(tab.url) != page_number:
+            return None, False
+        await handle_dynamic_content_loading(tab, job)
+        html = await capture_html(tab, job)
+        has_next = await find_next_button(tab, job) is not None
+        return html, has_next
+    finally:
+        try:
+            await tab.close()
+        except Exception:
+            pass
+
+async def scrape_with_fanout(start_url: str, job: CrawlJob, context):
+    """
+    Fetches numerically paginated sites by URL instead of clicking 'Next' page by page.
+    One 'Next' click confirms the page-N URL template, then pages are loaded `job.fanout`
+    tabs at a time. Returns None when the listing is done, the URL from which the
+    click chain should take over when the template can't be confirmed or a fetch fails,
+    or a CrawlFailure when the site throttled or errored and the retry policy should wait.
+    """
+    print(f"\n--- Starting fan-out session at: {start_url} ---")
+    ACTION_TIMEOUT = 30000
+
+    page = await context.new_page()
+    try:
+        response = await traced_goto(page, start_url, job, timeout=60000, wait_until='load')
+        kind, retry_after = classify_response(response)
+        if kind is not None:
+            print(f"-> {start_url} answered HTTP {response.status} ({kind}).")
+            return CrawlFailure(kind, start_url, f"HTTP {response.status}", retry_after)
+        if start_url not in job.visited_urls:
+            await handle_dynamic_content_loading(page, job)
+            await store_page(job, start_url, await capture_html(page, job))
+        if page_limit_reached(job):
+            return None
+
+        next_button = await find_next_button(page, job)
+        if next_button is None:
+            print("-> No 'Next' button on the first page; nothing to fan out.")
+            return None
+        response = await click_next(page, next_button, job, ACTION_TIMEOUT)
+        second_url = page.url
+        kind, retry_after = classify_response(response)
+        if kind == "terminal":
+            print(f"-> 'Next' led to HTTP {response.status}; the listing ends here.")
+            return None
+        if kind is not None:
+            return CrawlFailure(kind, second_url, f"HTTP {response.status} after 'Next'", retry_after)
+        await job.sink.record_cursor(second_url)
+
+        # The start URL may not carry a number (page 1 is often implicit); the model
+        # handles that, and must reproduce the URL 'Next' actually led to.
+        model = job.pagination or PaginationModel.learn([start_url, second_url])
+        first_number = model.page_number(start_url) if model is not None else None
+        if (model is None or not model.can_generate or first_number is None
+                or model.url_for(first_number + 1) != second_url):
+            print(f"-> Could not confirm a page-N URL pattern from {second_url}; clicking 'Next' instead.")
+            return second_url
+        job.pagination = model
+        print(f"-> Confirmed pagination: {model.key} in the {model.location}, step {model.step}, base {model.base}")
+
+        if second_url not in job.visited_urls:
+            await handle_dynamic_content_loading(page, job)
+            await store_page(job, second_url, await capture_html(page, job))
+        last_stored_url = second_url
+        if await find_next_button(page, job) is None or page_limit_reached(job):
+            return None
+    except Exception as e:
+        print(f"[!] Fan-out setup failed: {e!r}. Clicking 'Next' instead.")
+        return page.url if page.url.startswith("http") else start_url
+    finally:
+        try:
+            await page.close()
+        except Exception:
+            pass
+
+    next_number = first_number + 2
+    while True:
+        numbers = list(range(next_number, next_number + job.fanout))
+        urls = model.urls_for(numbers)
+        print(f"-> Fetching pages {numbers[0]}..{numbers[-1]} in {len(numbers)} tabs.")
+        results = await asyncio.gather(
+            *(capture_numbered_page(context, url, number, job) for url, number in zip(urls, numbers)),
+            return_exceptions=True,
+        )
+        # Results are committed in page order, so anything fetched past the last page is dropped.
+        for url, result in zip(urls, results):
+            if isinstance(result, Exception):
+                print(f"[!] Direct fetch of {url} failed: {result!r}. Clicking 'Next' instead.")
+                return last_stored_url
+            if isinstance(result, CrawlFailure):
+                print(f"[!] {url} answered {result.detail} ({result.kind}); backing off.")
+                return result
+            html, has_next = result
+            if html is None:
+                print(f"-> {url} is past the last page.")
+                return None
+            if url not in job.visited_urls:
+                await store_page(job, url, html)
+            last_stored_url = url
+            await job.sink.record_cursor(url)
+            if not has_next or page_limit_reached(job):
+                return None
+        next_number += job.fanout
+
+NEXT_HINT_SCRIPT = """
+(nextUrl) => {
+    if (document.querySelector('a[rel~="next" i], link[rel~="next" i]')) return true;
+    if (!nextUrl) return false;
+    return Array.from(document.querySelectorAll('a[href]')).some(a => a.href === nextUrl);
+}
+"""
+
+async def classify_missing_next(page, job: CrawlJob) -> str:
+    """
+    Tells the real end of a listing from selectors that stopped matching. The page still
+    pointing at a next page (rel="next", or a link to the URL the pagination model expects)
+    means our selectors drifted; otherwise pagination is over.
+    """
+    next_url = None
+    model = job.pagination
+    if model is not None and model.can_generate:
+        number = model.page_number(page.url)
+        if number is not None:
+            next_url = model.url_for(number + 1)
+    try:
+        return "selector_drift" if await page.evaluate(NEXT_HINT_SCRIPT, next_url) else "terminal"
+    except Exception as e:
+        return classify_error(e)
+
+class RetryPolicy:
+    """
+    Turns a CrawlFailure into a wait before the next attempt, or None to stop. Terminal
+    failures stop at once. The rest back off exponentially with full jitter (throttling
+    starts higher and honours Retry-After), drift gets a couple of tries at most, and each
+    host has a retry budget shared by every job in the run.
+    """
+    KIND_BASE_DELAY = {"transient": 1.0, "crash": 1.0, "selector_drift": 2.0, "throttled": 15.0}
+    KIND_MAX_ATTEMPTS = {"selector_drift": 2}
+
+    def __init__(self, base_delay: float = 2.0, max_delay: float = 300.0, host_budget: int = 100):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.host_budget = host_budget
+        self.host_retries = Counter()
+
+    def delay(self, failure: CrawlFailure, attempt: int):
+        """
+        `attempt` counts consecutive failures of the job without progress, starting at 1.
+        """
+        if failure.kind == "terminal" or attempt > self.KIND_MAX_ATTEMPTS.get(failure.kind, attempt):
+            return None
+        host = urlsplit(failure.url).hostname
+        if self.host_budget and self.host_retries[host] >= self.host_budget:
+            print(f"[!] Retry budget for {host} is used up ({self.host_budget} retries).")
+            return None
+        self.host_retries[host] += 1
+        if failure.retry_after is not None:
+            return min(self.max_delay, failure.retry_after)
+        ceiling = self.base_delay * self.KIND_BASE_DELAY.get(failure.kind, 1.0) * 2 ** (attempt - 1)
+        return random.uniform(0, min(self.max_delay, ceiling))
+
+async def scrape_with_playwright(start_url: str, job: CrawlJob, context):
+    """
+    Scrapes a site and streams each page's final HTML to job.sink.
+    Runs in a warm context handed out by the BrowserPool; only the page is opened and closed here.
+    Returns a CrawlFailure saying why and where to try again, or None once the crawl is finished.
     """
     print(f"\n--- Starting new scraping session at: {start_url} ---")
     ACTION_TIMEOUT = 30000
 
-    visited_urls = existing_visited_urls
+    visited_urls = job.visited_urls
     last_successful_url = start_url
 
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
-        context = await browser.new_context(
-            user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/114.0.0.0 Safari/537.36"
-        )
-        page = await context.new_page()
-        
+    page = await context.new_page()
+    try:
         try:
             # CRITICAL FIX: Changed 'networkidle' to 'load' for reliability.
-            await page.goto(start_url, timeout=60000, wait_until='load')
-        except TimeoutError as e:
-            print(f"[!] FATAL ERROR: Page.goto timed out: {e}")
-            await browser.close()
-            return start_url, visited_urls
+            response = await traced_goto(page, start_url, job, timeout=60000, wait_until='load')
+        except Exception as e:
+            print(f"[!] FATAL ERROR: Page.goto failed: {e}")
+            return CrawlFailure(classify_error(e), start_url, f"goto: {e!r}")
+        kind, retry_after = classify_response(response)
+        if kind is not None:
+            print(f"[!] {start_url} answered HTTP {response.status} ({kind}).")
+            return CrawlFailure(kind, start_url, f"HTTP {response.status}", retry_after)
 
-        previous_page_number = get_page_number(start_url)
         previous_url = start_url
 
         while True:
@@ -121,127 +1972,863 @@ async def scrape_with_playwright(start_url: str, existing_visited_urls: set, scr
                 print(f"-> Already scraped {current_url}. Re-evaluating page...")
             else:
                 print(f"Scraping URL: {current_url}")
-                await handle_dynamic_content_loading(page)
+                await handle_dynamic_content_loading(page, job)
                 
                 print(f"-> Capturing final HTML for: {current_url}")
-                # NEW: Capture HTML and add it to our data dictionary
-                scraped_data[current_url] = await page.content()
-                
-                visited_urls.add(current_url)
+                # Hand the rendered page to the job's sink, which writes it in the background.
+                await store_page(job, current_url, await capture_html(page, job))
                 last_successful_url = current_url
+
+                if page_limit_reached(job):
+                    print(f"-> Reached the page limit of {job.max_pages}.")
+                    return None
             
-            current_page_number = get_page_number(current_url)
-            if current_page_number > previous_page_number + 1:
+            if job.pagination is None and current_url != previous_url:
+                # Learned once per job from its first click, then reused across restarts.
+                job.pagination = PaginationModel.learn([previous_url, current_url])
+            current_page_number, previous_page_number = (
+                job.pagination.page_numbers([current_url, previous_url]) if job.pagination is not None
+                else (get_page_number(current_url), get_page_number(previous_url)))
+            if (None not in (current_page_number, previous_page_number)
+                    and current_page_number > previous_page_number + 1):
                 print("\n[!] PAGE SKIP DETECTED!")
-                print(f"    Forcing a restart from the last good URL: {previous_url}")
-                await browser.close()
-                return previous_url, visited_urls
+                recovered = False
+                for recovery in range(1, MAX_SKIP_RECOVERIES + 1):
+                    print(f"    Recovering page {previous_page_number + 1} in this session "
+                          f"(attempt {recovery}/{MAX_SKIP_RECOVERIES})...")
+                    try:
+                        recovered = await recover_skipped_page(page, job, previous_url,
+                                                               previous_page_number + 1, ACTION_TIMEOUT)
+                    except Exception as e:
+                        print(f"    In-session recovery failed: {e!r}")
+                        if page.is_closed() or classify_error(e) == "crash":
+                            break  # the session itself is gone; only a restart helps
+                    if recovered:
+                        break
+                if not recovered:
+                    print(f"    Forcing a restart from the last good URL: {previous_url}")
+                    return CrawlFailure("transient", previous_url, "page skip")
+                await job.sink.record_cursor(page.url)
+                continue
 
             try:
-                # CRITICAL FIX: Restored the correct selectors for 'Next' buttons.
-                next_button_selectors = [
-                    'a[rel="next"]', 'button[rel="next"]',
-                    'nav[aria-label*="pagination" i] a:has-text("Next")',
-                    'nav[aria-label*="pagination" i] button:has-text("Next")',
-                    'li.pagination-item--next a', '.pagination a:has-text("Next")',
-                    '.pagination button:has-text("Next")', 'button:has-text("Next")',
-                    'a[aria-label*="next" i]', 'button[aria-label*="next" i]',
-                    'a[title*="next" i]', 'button[title*="next" i]'
-                ]
-                next_button = None
-                for selector in next_button_selectors:
-                    try:
-                        candidate_button = page.locator(selector).first
-                        await candidate_button.wait_for(state='visible', timeout=1000)
-                        if await candidate_button.is_enabled():
-                            next_button = candidate_button
-                            print(f"Found 'Next' button with selector: '{selector}'")
-                            break 
-                    except Exception:
-                        continue
-                
+                next_button = await find_next_button(page, job)
                 if next_button is None:
-                    raise Exception("Could not find a valid 'Next' button.")
+                    kind = await classify_missing_next(page, job)
+                    if kind == "terminal":
+                        print("-> No 'Next' button and no sign of a next page. Pagination is complete.")
+                        return None
+                    print(f"\n[!] Could not find a valid 'Next' button, but the page links onward ({kind}).")
+                    return CrawlFailure(kind, last_successful_url, "no 'Next' selector matched")
 
-                await asyncio.sleep(random.uniform(1.5, 4.0))
-                await next_button.click(timeout=ACTION_TIMEOUT)
+                response = await click_next(page, next_button, job, ACTION_TIMEOUT)
+                kind, retry_after = classify_response(response)
+                if kind == "terminal":
+                    print(f"-> 'Next' led to HTTP {response.status}; the listing ends here.")
+                    return None
+                if kind is not None:
+                    # The error page must not be stored as a page; retry the URL it replaced.
+                    print(f"\n[!] 'Next' led to HTTP {response.status} ({kind}).")
+                    return CrawlFailure(kind, page.url, f"HTTP {response.status} after 'Next'", retry_after)
+                await job.sink.record_cursor(page.url)
                 
-                await page.wait_for_url(lambda url: url != current_url, timeout=ACTION_TIMEOUT)
-                
-                previous_page_number = current_page_number
                 previous_url = current_url
 
             except Exception as e:
-                print(f"\n[!] SCRAPER FAILED or finished.")
+                print(f"\n[!] SCRAPER FAILED.")
                 print(f"   The last successful URL was: {last_successful_url}")
                 print(f"   Reason: {repr(e)}")
-                await browser.close()
-                return last_successful_url, visited_urls
+                return CrawlFailure(classify_error(e), last_successful_url, repr(e))
         
-    await browser.close()
-    return None, visited_urls
+    finally:
+        try:
+            await page.close()
+        except Exception:
+            pass
+
+    return None
 
-async def main():
+class PageStore:
     """
-    Orchestrator: Manages state and saves the scraped HTML data to files.
+    Content-addressed, compressed page storage.
+    Each distinct body is stored once as objects/<h[:2]>/<h[2:4]>/<sha256>.<media>.<ext>, compressed
+    with zstd when available and gzip otherwise. index.jsonl maps every URL to its blob;
+    when a URL appears more than once, the last entry wins.
     """
-    print("--- Resilient & Adaptable Scraping Orchestrator ---")
-    url_input = input("Please enter the full starting URL to scrape: ").strip()
+    CODECS = {"zstd": ".zst", "gzip": ".gz"}
 
-    if not url_input:
-        print("No URL entered. Exiting.")
-        return
+    def __init__(self, root_dir: str, codec: str = None):
+        self.root_dir = root_dir
+        self.codec = codec or ("zstd" if zstandard is not None else "gzip")
+        if self.codec == "zstd" and zstandard is None:
+            raise RuntimeError("zstd compression needs the 'zstandard' package")
+        self.index_path = os.path.join(root_dir, "index.jsonl")
+        self.saved_count = 0  # index entries of every kind
+        self.page_count = 0  # of which kind "page"
+        self.duplicate_count = 0
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+        self._known_hashes = set()
+        os.makedirs(os.path.join(root_dir, "objects"), exist_ok=True)
 
-    if not re.match(r'^https?:\/\/', url_input):
-        url_input = f"https://{url_input}"
-        print(f"Assuming you meant: {url_input}")
+    def blob_path(self, digest: str, codec: str = None, media: str = "html") -> str:
+        extension = f".{media}{self.CODECS[codec or self.codec]}"
+        return os.path.join(self.root_dir, "objects", digest[:2], digest[2:4], digest + extension)
 
-    next_url_to_scrape = url_input
-    master_visited_urls = set()
-    # NEW: Dictionary to hold our scraped HTML data
-    master_scraped_data = {}
-    max_restarts = 30
-    restart_count = 0
+    def _compress(self, data: bytes) -> bytes:
+        if self.codec == "zstd":
+            return zstandard.ZstdCompressor(level=9).compress(data)
+        return gzip.compress(data, compresslevel=6)
 
-    while next_url_to_scrape is not None and restart_count < max_restarts:
-        if restart_count > 0:
-            print("\n----------------------------------------------------")
-            print(f"RESTARTING (Attempt {restart_count}/{max_restarts}). Waiting for 10 seconds...")
-            print("----------------------------------------------------")
-            await asyncio.sleep(10)
-
-        # NEW: Pass the data dictionary to the scraper function
-        next_url_to_scrape, master_visited_urls = await scrape_with_playwright(
-            next_url_to_scrape, 
-            master_visited_urls,
-            master_scraped_data
-        )
-        restart_count += 1
-    
-    print("\n--- ORCHESTRATOR FINISHED ---")
-    if restart_count >= max_restarts:
-        print(f"Stopped due to reaching the max restart limit of {max_restarts}.")
-
-    print(f"\nTotal unique URLs visited: {len(master_visited_urls)}")
-    
-    # NEW: Save the captured HTML to files
-    if master_scraped_data:
-        output_dir = "scraped_pages"
+    def put(self, url: str, content: str, media: str = "html", kind: str = "page") -> str:
+        """
+        Stores a body (once per distinct content) and records url -> blob in the index.
+        `media` is "html" or "json"; `kind` says what the body is: a "page" (also when
+        it is in-browser extraction JSON), an "api" payload or a "harvest" batch.
+        Returns the sha256 digest.
+        """
+        data = content.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.blob_path(digest, media=media)
+        stored_size = 0
+        if digest in self._known_hashes or os.path.exists(path):
+            self.duplicate_count += 1
+        else:
+            compressed = self._compress(data)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temporary name first so a crash never leaves a truncated blob behind.
+            temporary_path = f"{path}.tmp"
+            with open(temporary_path, "wb") as f:
+                f.write(compressed)
+            os.replace(temporary_path, path)
+            stored_size = len(compressed)
+        self._known_hashes.add(digest)
+
+        entry = {"url": url, "sha256": digest, "codec": self.codec, "media": media, "kind": kind, "size": len(data),
+                 "stored": stored_size, "captured_at": time.time()}
+        with open(self.index_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+        self.saved_count += 1
+        if kind == "page":
+            self.page_count += 1
+        self.raw_bytes += len(data)
+        self.stored_bytes += stored_size
+        return digest
+
+    def load_index(self) -> dict:
+        """
+        Returns {url: index entry} for every URL stored so far.
+        """
+        index = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # a torn last line from an interrupted run
+                    index[entry["url"]] = entry
+        return index
+
+    def page_urls(self) -> list:
+        """
+        URLs of stored pages only, leaving out API payloads and harvest batches.
+        Index entries written before `kind` existed count as pages when they are HTML.
+        """
+        return [url for url, entry in self.load_index().items()
+                if entry.get("kind", "page" if entry.get("media", "html") == "html" else None) == "page"]
+
+    def read(self, digest: str, codec: str = None, media: str = "html") -> str:
+        codec = codec or self.codec
+        with open(self.blob_path(digest, codec, media), "rb") as f:
+            data = f.read()
+        if codec == "zstd":
+            if zstandard is None:
+                raise RuntimeError("reading zstd blobs needs the 'zstandard' package")
+            data = zstandard.ZstdDecompressor().decompress(data)
+        else:
+            data = gzip.decompress(data)
+        return data.decode("utf-8")
+
+class PageSink:
+    """
+    Writes captured pages to disk as soon as they arrive, from a bounded queue.
+    put() waits while the queue is full, so a slow disk slows the crawl down
+    instead of letting pages pile up in memory.
+    """
+    def __init__(self, store: PageStore, max_pending: int = 4, metrics: Metrics = None,
+                 checkpoint: "CrawlCheckpoint" = None):
+        self.store = store
+        self.metrics = metrics
+        self.checkpoint = checkpoint
+        self._write_failed = False
+        self._queue = asyncio.Queue(maxsize=max_pending)
+        self._writer = None
+
+    async def start(self):
+        self._writer = asyncio.create_task(self._run())
+        return self
+
+    async def put(self, url: str, content: str, media: str = "html", kind: str = "page"):
+        await self._queue.put((url, content, media, kind))
+
+    async def record_cursor(self, url: str):
+        """
+        Moves the checkpoint cursor to `url` once every page queued before it is on disk,
+        so --resume never starts past a page that was still waiting to be written.
+        """
+        await self._queue.put(url)
+
+    async def _run(self):
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+            if isinstance(item, str):
+                # After a failed write the cursor stays put, so a resume retries that page.
+                if self.checkpoint is not None and not self._write_failed:
+                    self.checkpoint.record("cursor", item)
+                continue
+            await asyncio.to_thread(self._write, *item)
+
+    def _write(self, url: str, content: str, media: str, kind: str):
+        try:
+            raw_before, stored_before = self.store.raw_bytes, self.store.stored_bytes
+            digest = self.store.put(url, content, media, kind)
+            if self.metrics is not None:
+                self.metrics.inc("scraper_bytes_captured_total", self.store.raw_bytes - raw_before, media=media)
+                self.metrics.inc("scraper_bytes_stored_total", self.store.stored_bytes - stored_before, media=media)
+            print(f"  - Saved {url} as {digest[:12]}")
+        except Exception as e:
+            print(f"  - FAILED to save {url}. Reason: {e}")
+            self._write_failed = True
+
+    async def close(self):
+        """
+        Waits for every queued page to be written, then stops the writer.
+        """
+        if self._writer is None:
+            return
+        await self._queue.put(None)
+        await self._writer
+        self._writer = None
+
+@lru_cache(maxsize=512)
+def _compile_selector(selector: str):
+    """
+    Compiles a schema selector once per worker process. Selectors starting with "/", "./"
+    or "xpath:" are XPath; anything else is CSS.
+    """
+    if selector.startswith("xpath:"):
+        return etree.XPath(selector[len("xpath:"):])
+    if selector.startswith(("/", "./", "(")):
+        return etree.XPath(selector)
+    from lxml.cssselect import CSSSelector
+    return CSSSelector(selector)
+
+def _field_value(node, page_url: str, spec):
+    """
+    Evaluates one field spec against a node. A spec is a selector string or a dict with
+    "selector", optional "attr" and optional "all" (return every match as a list).
+    """
+    if isinstance(spec, str):
+        spec = {"selector": spec}
+    selector, attr = spec.get("selector"), spec.get("attr")
+    matches = _compile_selector(selector)(node) if selector else [node]
+    values = []
+    for match in matches:
+        if not isinstance(match, etree._Element):
+            value = str(match)  # XPath text() or @attr results
+        elif attr:
+            value = match.get(attr)
+            if value is not None and attr in ("href", "src"):
+                value = urljoin(page_url, value)
+        else:
+            value = " ".join(match.text_content().split())
+        if value is not None:
+            values.append(value)
+        if values and not spec.get("all"):
+            break
+    if spec.get("all"):
+        return values
+    return values[0] if values else None
+
+def extract_records(schema: dict, url: str, html: str) -> list:
+    """
+    Applies a declarative schema to one page and returns its records:
+        {"items": ".quote",
+         "fields": {"text": ".text", "author": ".author",
+                    "tags": {"selector": ".tags .tag", "all": true},
+                    "author_url": {"selector": "a", "attr": "href"}}}
+    Without "items" the whole page yields a single record. Runs in a worker process.
+    """
+    document = lxml.html.fromstring(html)
+    items = _compile_selector(schema["items"])(document) if schema.get("items") else [document]
+    records = []
+    for item in items:
+        record = {name: _field_value(item, url, spec) for name, spec in schema.get("fields", {}).items()}
+        record["_url"] = url
+        records.append(record)
+    return records
+
+class ExtractionPipeline:
+    """
+    Turns captured pages into records off the event loop. Parsing runs in a shared process
+    pool, so the browser keeps rendering while other cores parse; records are appended to
+    records.jsonl as each page finishes. submit() waits while too many pages are in flight.
+    """
+    def __init__(self, output_dir: str, schema: dict, executor: ProcessPoolExecutor = None, max_pending: int = 8):
+        if executor is not None and lxml is None:
+            raise RuntimeError("structured extraction needs the 'lxml' package ('cssselect' too for CSS selectors)")
+        self.schema = schema
+        self.executor = executor
+        self.record_count = 0
+        self._slots = asyncio.Semaphore(max_pending)
+        self._tasks = set()
+        os.makedirs(output_dir, exist_ok=True)
+        self._file = open(os.path.join(output_dir, "records.jsonl"), "a", encoding="utf-8")
+
+    async def submit(self, url: str, html: str):
+        if self.executor is None:
+            return  # records only come from the browser; see extract_in_page()
+        await self._slots.acquire()
+        task = asyncio.create_task(self._extract(url, html))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _extract(self, url: str, html: str):
+        try:
+            loop = asyncio.get_running_loop()
+            records = await loop.run_in_executor(self.executor, extract_records, self.schema, url, html)
+            await self.write_records(url, records)
+        except Exception as e:
+            print(f"  - FAILED to extract {url}. Reason: {e}")
+        finally:
+            self._slots.release()
+
+    async def write_records(self, url: str, records: list):
+        self._file.write("".join(json.dumps(record) + "\n" for record in records))
+        self._file.flush()
+        self.record_count += len(records)
+        print(f"  - Extracted {len(records)} records from {url}")
+
+    async def close(self):
+        """
+        Waits for in-flight pages to be parsed and written, then closes the output file.
+        """
+        if self._tasks:
+            await asyncio.gather(*self._tasks)
+        self._file.close()
+
+class CrawlCheckpoint:
+    """
+    Append-only progress log for one job (checkpoint.jsonl next to its page store).
+    It records the pagination cursor, i.e. the page the crawl is on, and whether the
+    job finished. Which pages are already persisted comes from the store's index.
+    """
+    def __init__(self, output_dir: str, resume: bool = False):
+        self.path = os.path.join(output_dir, "checkpoint.jsonl")
         os.makedirs(output_dir, exist_ok=True)
-        print(f"\nSaving {len(master_scraped_data)} captured HTML pages to '{output_dir}/' directory...")
-        for url, content in master_scraped_data.items():
-            # Sanitize URL to create a safe filename
-            sanitized_name = re.sub(r'[^\w\-_\. ]', '_', url)
-            file_path = os.path.join(output_dir, f"{sanitized_name}.html")
+        self._lock = threading.Lock()
+        self._file = open(self.path, "a" if resume else "w", encoding="utf-8")
+
+    def record(self, event: str, url: str = None):
+        line = json.dumps({"event": event, "url": url, "at": time.time()})
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def replay(self):
+        """
+        Returns (cursor, finished) from the log: the last page the crawl reached, and
+        whether the job already ran to completion.
+        """
+        cursor, finished = None, False
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # a torn last line from a crash
+                if entry["event"] == "cursor":
+                    cursor, finished = entry["url"], False
+                elif entry["event"] == "finished":
+                    finished = True
+        return cursor, finished
+
+    def close(self):
+        self._file.close()
+
+class UrlCanonicalizer:
+    """
+    Maps the many spellings of one page to a single string: lowercase scheme and host,
+    no default port, sorted query without tracking parameters, no trailing slash, and
+    no plain #anchors. Fragments that look like state ("#!/...", "#/...", "#page=2") stay,
+    since single-page apps paginate there.
+    """
+    DEFAULT_STRIP = ("utm_*", "fbclid", "gclid", "dclid", "gbraid", "wbraid", "msclkid", "yclid", "mc_cid",
+                     "mc_eid", "igshid", "_ga", "_gl", "_hsenc", "_hsmi", "ref_src", "spm", "phpsessid",
+                     "jsessionid", "sessionid")
+    DEFAULT_PORTS = {"http": 80, "https": 443}
+
+    def __init__(self, strip_params=(), keep_fragments: bool = False):
+        names = [name.lower() for name in (*self.DEFAULT_STRIP, *strip_params)]
+        self.strip_exact = {name for name in names if not name.endswith("*")}
+        self.strip_prefixes = tuple(name[:-1] for name in names if name.endswith("*"))
+        self.keep_fragments = keep_fragments
+
+    def _keeps(self, name: str) -> bool:
+        name = name.lower()
+        return name not in self.strip_exact and not name.startswith(self.strip_prefixes)
+
+    def canonical(self, url: str) -> str:
+        parts = urlsplit(url.strip())
+        scheme = parts.scheme.lower()
+        try:
+            port = parts.port
+        except ValueError:
+            port = None
+        netloc = (parts.hostname or "").rstrip(".")
+        if port and port != self.DEFAULT_PORTS.get(scheme):
+            netloc += f":{port}"
+        path = re.sub(r';jsessionid=[^/?#]*', '', parts.path, flags=re.IGNORECASE)
+        path = re.sub(r'%[0-9a-f]{2}', lambda m: m.group().upper(), path) or "/"
+        if len(path) > 1:
+            path = path.rstrip("/") or "/"
+        query = urlencode(sorted((name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+                                 if self._keeps(name)))
+        fragment = parts.fragment
+        if not (self.keep_fragments or fragment.startswith(("!", "/")) or "=" in fragment):
+            fragment = ""
+        return urlunsplit((scheme, netloc, path, query, fragment))
+
+    def key(self, url: str) -> int:
+        """
+        64-bit hash of the canonical URL; never 0, which the hash store uses for empty slots.
+        """
+        digest = hashlib.blake2b(self.canonical(url).encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "big") or 1
+
+class VisitedStore:
+    """
+    The set of pages a job has already captured, keyed by canonical URL. Subclasses
+    decide how the 64-bit keys are kept; all of them answer `url in store` in constant time.
+    """
+    def __init__(self, canonicalizer: UrlCanonicalizer = None):
+        self.canonicalizer = canonicalizer or UrlCanonicalizer()
+        self.count = 0
+
+    def add(self, url: str):
+        if self._add_key(self.canonicalizer.key(url)):
+            self.count += 1
+
+    def update(self, urls):
+        for url in urls:
+            self.add(url)
+
+    def __contains__(self, url: str) -> bool:
+        return self._has_key(self.canonicalizer.key(url))
+
+    def __len__(self) -> int:
+        return self.count
+
+    def close(self):
+        pass
+
+class HashVisitedStore(VisitedStore):
+    """
+    Open-addressing table of 64-bit URL hashes in a flat array: about 16 bytes per URL
+    instead of the full URL string and set overhead.
+    """
+    def __init__(self, canonicalizer: UrlCanonicalizer = None, initial_slots: int = 1024):
+        super().__init__(canonicalizer)
+        self._slots = array("Q", bytes(8 * initial_slots))
+
+    def _probe(self, key: int) -> int:
+        mask = len(self._slots) - 1
+        index = key & mask
+        while self._slots[index] not in (0, key):
+            index = (index + 1) & mask
+        return index
+
+    def _has_key(self, key: int) -> bool:
+        return self._slots[self._probe(key)] == key
+
+    def _add_key(self, key: int) -> bool:
+        index = self._probe(key)
+        if self._slots[index] == key:
+            return False
+        self._slots[index] = key
+        if (self.count + 1) * 3 > len(self._slots) * 2:  # keep the load factor under 2/3
+            old_slots, self._slots = self._slots, array("Q", bytes(16 * len(self._slots)))
+            for old_key in old_slots:
+                if old_key:
+                    self._slots[self._probe(old_key)] = old_key
+        return True
+
+class BloomVisitedStore(VisitedStore):
+    """
+    Bloom filter sized for `capacity` URLs at `error_rate` false positives: about 1.2 bytes
+    per URL at 1%. A false positive skips a page that was never captured, so keep the
+    rate low, and use it for frontiers too large to hold exactly.
+    """
+    def __init__(self, canonicalizer: UrlCanonicalizer = None, capacity: int = 10_000_000,
+                 error_rate: float = 0.001):
+        super().__init__(canonicalizer)
+        self.bit_count = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.bit_count / capacity * math.log(2)))
+        self._bits = bytearray((self.bit_count + 7) // 8)
+
+    def _positions(self, key: int):
+        # Double hashing: the two halves of the 64-bit key generate every probe.
+        first, second = key >> 32, (key & 0xFFFFFFFF) | 1
+        return [(first + i * second) % self.bit_count for i in range(self.hash_count)]
+
+    def _has_key(self, key: int) -> bool:
+        return all(self._bits[bit >> 3] & (1 << (bit & 7)) for bit in self._positions(key))
+
+    def _add_key(self, key: int) -> bool:
+        added = False
+        for bit in self._positions(key):
+            if not self._bits[bit >> 3] & (1 << (bit & 7)):
+                self._bits[bit >> 3] |= 1 << (bit & 7)
+                added = True
+        return added
+
+class DiskVisitedStore(VisitedStore):
+    """
+    URL hashes in a SQLite table next to the job's pages, for frontiers that outgrow
+    memory. URLs are added when a page is queued, not when it is written, so --resume
+    rebuilds the table from the page index instead of trusting what a killed run left.
+    """
+    def __init__(self, path: str, canonicalizer: UrlCanonicalizer = None, reset: bool = False):
+        super().__init__(canonicalizer)
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS visited (key INTEGER PRIMARY KEY) WITHOUT ROWID")
+        if reset:
+            self._db.execute("DELETE FROM visited")
+            self._db.commit()
+        self.count = self._db.execute("SELECT COUNT(*) FROM visited").fetchone()[0]
+
+    @staticmethod
+    def _signed(key: int) -> int:
+        return key - (1 << 64) if key >= 1 << 63 else key  # SQLite integers are signed
+
+    def _has_key(self, key: int) -> bool:
+        return self._db.execute("SELECT 1 FROM visited WHERE key = ?", (self._signed(key),)).fetchone() is not None
+
+    def _add_key(self, key: int) -> bool:
+        # No per-URL commit: the table is rebuilt on resume, so only close() needs to flush.
+        return self._db.execute("INSERT OR IGNORE INTO visited (key) VALUES (?)", (self._signed(key),)).rowcount > 0
+
+    def close(self):
+        self._db.commit()
+        self._db.close()
+
+def make_visited_store(job: CrawlJob) -> VisitedStore:
+    canonicalizer = UrlCanonicalizer(job.strip_params, job.keep_fragments)
+    if job.visited_store == "bloom":
+        return BloomVisitedStore(canonicalizer, capacity=job.visited_capacity)
+    if job.visited_store == "disk":
+        return DiskVisitedStore(os.path.join(job.output_dir, "visited.sqlite"), canonicalizer, reset=True)
+    if job.visited_store != "hash":
+        raise ValueError(f"unknown visited store '{job.visited_store}'")
+    return HashVisitedStore(canonicalizer)
+
+async def prepare_context(context, job: CrawlJob):
+    """
+    Applies a job's per-context setup to a freshly acquired context.
+    """
+    await context.add_init_script(SETTLE_INIT_SCRIPT)
+    if job.resource_policy is not None:
+        await job.resource_policy.install(context)
+
+async def run_crawl(job: CrawlJob, pool: BrowserPool):
+    """
+    Drives one job through its restart attempts in its own context, streaming pages to disk.
+    """
+    next_url_to_scrape = job.start_url
+    restart_count = 0
+
+    store = PageStore(job.output_dir, job.compression)
+    job.checkpoint = CrawlCheckpoint(job.output_dir, resume=job.resume)
+    job.visited_urls = make_visited_store(job)
+    if job.resume:
+        cursor, finished = job.checkpoint.replay()
+        # The index is the only record of what reached disk, for every visited backend.
+        job.visited_urls.update(store.page_urls())
+        if finished:
+            print(f"-> Job {job.job_id} already finished; nothing to resume.")
+            job.checkpoint.close()
+            job.visited_urls.close()
+            return
+        next_url_to_scrape = cursor or job.start_url
+        print(f"-> Resuming at {next_url_to_scrape} with {len(job.visited_urls)} pages already saved.")
+    else:
+        job.checkpoint.record("cursor", job.start_url)
+
+    if job.block_resources:
+        job.resource_policy = ResourcePolicy.for_job(job)
+
+    # Pages are written by the sink while the crawl runs, not after it ends.
+    job.sink = await PageSink(store, metrics=job.metrics, checkpoint=job.checkpoint).start()
+    context = None
+    try:
+        if job.schema and (job.extract_pool is not None or job.extract_in_browser):
+            job.extractor = ExtractionPipeline(job.output_dir, job.schema, job.extract_pool)
+        context = await pool.acquire()
+        await prepare_context(context, job)
+        if job.http_engine is not None and job.http_engine.mode_for(next_url_to_scrape) != "browser":
+            next_url_to_scrape = await scrape_over_http(next_url_to_scrape, job, context)
+        failure = None
+        if job.fanout > 1 and next_url_to_scrape is not None:
+            handover = await scrape_with_fanout(next_url_to_scrape, job, context)
+            if isinstance(handover, CrawlFailure):
+                failure, next_url_to_scrape = handover, handover.url
+            else:
+                next_url_to_scrape = handover
+
+        attempt = 1 if failure is not None else 0
+        while next_url_to_scrape is not None and restart_count < job.max_restarts:
+            if failure is not None:
+                delay = job.retry_policy.delay(failure, attempt)
+                if delay is None:
+                    print(f"[!] Not retrying a {failure.kind} failure ({failure.detail}).")
+                    if failure.kind == "terminal":
+                        next_url_to_scrape = None
+                    break
+                job.metrics.inc("scraper_restarts_total", reason=failure.kind)
+                print("\n----------------------------------------------------")
+                print(f"RESTARTING after a {failure.kind} failure (Attempt {restart_count}/{job.max_restarts}). "
+                      f"Waiting for {delay:.1f} seconds...")
+                print("----------------------------------------------------")
+                await asyncio.sleep(delay)
+                renewed_context = await pool.renew(context)
+                if renewed_context is not context:
+                    await prepare_context(renewed_context, job)
+                context = renewed_context
+
+            pages_before = len(job.visited_urls)
+            failure = await scrape_with_playwright(next_url_to_scrape, job, context)
+            next_url_to_scrape = failure.url if failure is not None else None
+            # Backoff grows only while attempts make no progress.
+            attempt = 1 if len(job.visited_urls) > pages_before else attempt + 1
+            restart_count += 1
+    finally:
+        if context is not None:
+            await pool.release(context)
+        await job.sink.close()
+        if job.extractor is not None:
+            await job.extractor.close()
+        if next_url_to_scrape is None:
+            job.checkpoint.record("finished")
+        job.checkpoint.close()
+        job.visited_urls.close()
+
+    print(f"\n--- JOB FINISHED: {job.job_id or job.start_url} ---")
+    if next_url_to_scrape is not None and restart_count >= job.max_restarts:
+        print(f"Stopped due to reaching the max restart limit of {job.max_restarts}.")
+
+    print(f"\nTotal unique URLs visited: {len(job.visited_urls)}")
+    store = job.sink.store
+    print(f"Saved {store.page_count} captured pages to '{job.output_dir}/' "
+          f"({store.saved_count} index entries, {store.duplicate_count} duplicates, {store.raw_bytes} bytes -> {store.stored_bytes} bytes {store.codec}).")
+    if job.extractor is not None:
+        print(f"Extracted {job.extractor.record_count} records to '{job.output_dir}/records.jsonl'.")
+    if job.resource_policy is not None:
+        print(job.resource_policy.summary())
+
+async def run_batch(jobs: list, pool: BrowserPool, concurrency: int):
+    """
+    Runs many jobs on the shared pool, at most `concurrency` of them at a time.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_one(job):
+        async with semaphore:
             try:
-                with open(file_path, "w", encoding="utf-8") as f:
-                    f.write(content)
-                print(f"  - Saved {file_path}")
+                await run_crawl(job, pool)
             except Exception as e:
-                print(f"  - FAILED to save {file_path}. Reason: {e}")
+                print(f"[!] Job {job.job_id} failed: {e!r}")
+
+    await asyncio.gather(*(run_one(job) for job in jobs))
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Resilient & Adaptable Scraping Orchestrator")
+    parser.add_argument("--batch", metavar="JOBS_JSONL",
+                        help="Run every job in this JSONL file instead of asking for a URL.")
+    parser.add_argument("--concurrency", type=int, default=4,
+                        help="Maximum number of batch jobs crawling at once (default: 4).")
+    parser.add_argument("--browsers", type=int, default=1,
+                        help="Number of browser instances in the shared pool (default: 1).")
+    parser.add_argument("--fanout", type=int, default=0,
+                        help="Fetch numbered pages directly in this many tabs at once (default: off).")
+    parser.add_argument("--compression", choices=sorted(PageStore.CODECS),
+                        help="Page compression (default: zstd if installed, otherwise gzip).")
+    parser.add_argument("--no-block-resources", dest="block_resources", action="store_false",
+                        help="Load images, media, fonts and analytics instead of blocking them.")
+    parser.add_argument("--no-http-first", dest="http_first", action="store_false",
+                        help="Always render with Playwright instead of trying plain HTTP first.")
+    parser.add_argument("--selector-cache", metavar="PATH",
+                        help="Where learned per-host selectors are kept "
+                             "(default: selector_cache.json in the output directory).")
+    parser.add_argument("--api-replay", action="store_true",
+                        help="Page through the JSON API behind infinite scroll/load-more instead of the DOM.")
+    parser.add_argument("--harvest-selector", metavar="CSS",
+                        help="Stream matching feed items out after every scroll round.")
+    parser.add_argument("--evict-harvested", action="store_true",
+                        help="Remove harvested items from the live DOM (needs --harvest-selector).")
+    parser.add_argument("--max-load-seconds", type=float, default=300,
+                        help="Wall-time budget for dynamic loading on one page; 0 for none (default: 300).")
+    parser.add_argument("--max-load-rounds", type=int, default=500,
+                        help="Scroll/click round budget per page; 0 for none (default: 500).")
+    parser.add_argument("--max-dom-nodes", type=int, default=0,
+                        help="Stop loading once the page has this many DOM nodes (default: no limit).")
+    parser.add_argument("--max-js-heap-mb", type=float, default=0,
+                        help="Stop loading once the page's JS heap reaches this size (default: no limit).")
+    parser.add_argument("--trace", metavar="JSONL",
+                        help="Append a timing event for every page phase to this file.")
+    parser.add_argument("--visited-store", choices=["hash", "bloom", "disk"], default="hash",
+                        help="How captured URLs are remembered: in-memory hashes (default), a bloom "
+                             "filter, or SQLite on disk for very large crawls.")
+    parser.add_argument("--visited-capacity", type=int, default=10_000_000,
+                        help="URLs the bloom filter is sized for (default: 10,000,000).")
+    parser.add_argument("--strip-params", type=lambda value: [name for name in value.split(",") if name],
+                        default=[], help="Extra comma-separated query parameters to ignore when comparing "
+                                         "URLs ('name*' matches a prefix).")
+    parser.add_argument("--keep-fragments", action="store_true",
+                        help="Treat URLs that differ only in their #fragment as different pages.")
+    parser.add_argument("--schemas",
+                        help="JSON file mapping host -> extraction schema; records go to records.jsonl per job.")
+    parser.add_argument("--extract-in-browser", action="store_true",
+                        help="Run the schema inside the page and store records instead of full HTML.")
+    parser.add_argument("--page-hash", action="store_true",
+                        help="With --extract-in-browser, also record a hash of each rendered page.")
+    parser.add_argument("--extract-workers", type=int, default=max(1, (os.cpu_count() or 2) - 1),
+                        help="Processes used to parse captured pages for extraction.")
+    parser.add_argument("--rate", type=float, default=0.4,
+                        help="Page loads, clicks and requests per second per host; 0 means no limit (default: 0.4).")
+    parser.add_argument("--burst", type=float, default=1,
+                        help="Requests a host may get back to back after a quiet spell (default: 1).")
+    parser.add_argument("--rate-jitter", type=float, default=0.5,
+                        help="Random extra wait, as a fraction of one request interval (default: 0.5).")
+    parser.add_argument("--host-rate", action="append", default=[], metavar="HOST=RATE[/BURST]",
+                        help="Override --rate (and --burst) for one host. Repeatable.")
+    parser.add_argument("--retry-base-delay", type=float, default=2.0,
+                        help="Base of the exponential backoff between session retries, in seconds (default: 2).")
+    parser.add_argument("--retry-max-delay", type=float, default=300.0,
+                        help="Longest wait between session retries, in seconds (default: 300).")
+    parser.add_argument("--host-retry-budget", type=int, default=100,
+                        help="Session retries allowed per host across all jobs; 0 means no limit (default: 100).")
+    parser.add_argument("--metrics-port", type=int,
+                        help="Serve Prometheus metrics at http://127.0.0.1:PORT/metrics while crawling.")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue each job from its checkpoint instead of starting over.")
+    parser.add_argument("--output-dir", default="scraped_pages",
+                        help="Root directory for saved pages (default: scraped_pages).")
+    return parser.parse_args(argv)
+
+async def main(args=None):
+    """
+    Orchestrator: Manages state and streams the scraped HTML data to files.
+    """
+    args = args or parse_args()
+    print("--- Resilient & Adaptable Scraping Orchestrator ---")
+
+    defaults = {"output_dir": args.output_dir, "fanout": args.fanout, "compression": args.compression,
+                "resume": args.resume, "block_resources": args.block_resources,
+                "http_first": args.http_first, "api_replay": args.api_replay,
+                "harvest_selector": args.harvest_selector, "evict_harvested": args.evict_harvested,
+                "max_load_seconds": args.max_load_seconds, "max_load_rounds": args.max_load_rounds,
+                "max_dom_nodes": args.max_dom_nodes, "max_js_heap_mb": args.max_js_heap_mb,
+                "extract_in_browser": args.extract_in_browser, "page_hash": args.page_hash,
+                "visited_store": args.visited_store, "visited_capacity": args.visited_capacity,
+                "strip_params": args.strip_params, "keep_fragments": args.keep_fragments}
+    if args.schemas:
+        with open(args.schemas, encoding="utf-8") as f:
+            defaults["schemas"] = json.load(f)
+    if args.batch:
+        jobs = load_jobs(args.batch, defaults)
+        if not jobs:
+            print(f"No jobs found in {args.batch}. Exiting.")
+            return
+        print(f"Loaded {len(jobs)} jobs; running up to {args.concurrency} at a time.")
+    else:
+        url_input = normalize_start_url(input("Please enter the full starting URL to scrape: "))
+        if not url_input:
+            print("No URL entered. Exiting.")
+            return
+        jobs = [CrawlJob.from_dict({"url": url_input, "output_dir": args.output_dir}, defaults)]
+
+    # Checked before anything is started, so a missing parser never strands a running sink or pool.
+    if any(job.schema and not job.extract_in_browser for job in jobs):
+        missing = [name for name in ("lxml", "cssselect") if importlib.util.find_spec(name) is None]
+        if missing:
+            print(f"Structured extraction needs {' and '.join(missing)} (pip install lxml cssselect), "
+                  f"or use --extract-in-browser. Exiting.")
+            return
+
+    http_engine = HttpFirstEngine()
+    selector_cache = SelectorCache(args.selector_cache or os.path.join(args.output_dir, "selector_cache.json"))
+    tracer = PhaseTracer(args.trace)
+    metrics = Metrics()
+    metrics.tracer = tracer
+    retry_policy = RetryPolicy(args.retry_base_delay, args.retry_max_delay, args.host_retry_budget)
+    rate_limiter = HostRateLimiter(args.rate, args.burst, args.rate_jitter)
+    for spec in args.host_rate:
+        host, _, limit = spec.partition("=")
+        rate, _, burst = limit.partition("/")
+        rate_limiter.configure(host, float(rate), float(burst) if burst else None)
+    for job in jobs:
+        if job.rate is not None:
+            rate_limiter.configure(urlsplit(job.start_url).hostname, job.rate, job.burst)
+        job.selector_cache = selector_cache
+        job.tracer = tracer
+        job.metrics = metrics
+        job.retry_policy = retry_policy
+        job.rate_limiter = rate_limiter
+        if job.http_first:
+            job.http_engine = http_engine
+
+    # Parsing for extraction happens in other processes so it never stalls the browser loop.
+    extract_pool = None
+    # In-browser extraction only needs the pool for pages fetched over plain HTTP.
+    if any(job.schema and (not job.extract_in_browser or lxml is not None) for job in jobs):
+        extract_pool = ProcessPoolExecutor(max_workers=max(1, args.extract_workers))
+        for job in jobs:
+            job.extract_pool = extract_pool
+
+    # The pool outlives every restart attempt, so a restart reuses the running browser.
+    pool = await BrowserPool(size=args.browsers).start()
+    metrics.pool = pool
+    metrics_server = None
+    if args.metrics_port:
+        metrics_server = await start_metrics_server(metrics, args.metrics_port)
+        print(f"-> Serving metrics at http://127.0.0.1:{args.metrics_port}/metrics")
+    try:
+        await run_batch(jobs, pool, max(1, args.concurrency))
+    finally:
+        if metrics_server is not None:
+            metrics_server.close()
+            await metrics_server.wait_closed()
+        print(f"-> Browser launches this run: {pool.launch_count}")
+        await pool.close()
+        if extract_pool is not None:
+            extract_pool.shutdown()
+        selector_cache.save()
+        tracer.close()
+
+    if tracer.histograms:
+        print("\n--- PHASE TIMINGS ---")
+        print(tracer.summary())
+
+    print("\n--- ORCHESTRATOR FINISHED ---")
 
 if __name__ == "__main__":
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
-        print("\nProcess interrupted by user. Exiting.")
\ No newline at end of file
+        print("\nProcess interrupted by user. Exiting.")
@@ -0,0 +1,31 @@
+import pytest
+
+from scraper import _payload_says_done, infer_api_pagination
+
+
+@pytest.mark.parametrize("records, param, kind, step", [
+    ([("https://a.example/api?ts=1&page=2", {"items": [1]}), ("https://a.example/api?ts=2&page=3", {"items": [1]})],
+     "page", "page", 1),
+    ([("https://a.example/api?_=1700000000000&offset=0", {"data": {"items": [1, 2]}}),
+      ("https://a.example/api?_=1700000000500&offset=2", {"data": {"items": [1, 2]}})],
+     "offset", "offset", 2),
+    ([("https://a.example/api?paged=1", {"items": [1]})], "paged", "page", 1),
+    ([("https://a.example/api?start=0", {"results": [1, 2, 3]})], "start", "offset", 3),
+    ([("https://a.example/api", {"data": {"items": [1]}, "next": "abc"}),
+      ("https://a.example/api?cursor=abc", {"data": {"items": [1]}, "next": "def"})],
+     "cursor", "cursor", 1),
+])
+def test_infer_api_pagination(records, param, kind, step):
+    pagination = infer_api_pagination(records)
+    assert (pagination.param, pagination.kind, pagination.step) == (param, kind, step)
+
+
+@pytest.mark.parametrize("payload, done", [
+    ({"data": {"items": [1, 2]}, "next": "x"}, False),
+    ({"data": {"items": [1], "has_more": False}}, True),
+    ({"items": [], "next": "x"}, True),
+    ([1, 2], False),
+    ({"hasMore": False, "results": [1]}, True),
+])
+def test_payload_says_done(payload, done):
+    assert _payload_says_done(payload) is done
@@ -0,0 +1,98 @@
+import pytest
+
+from scraper import PaginationModel, get_page_number
+
+# (first page URLs in page order, location, key, step, base, page numbers of those URLs, page-3 URL)
+LEARNED = [
+    (["https://example.com/list?page=1", "https://example.com/list?page=2"],
+     "query", "page=", 1, 1, [1, 2], "https://example.com/list?page=3"),
+    (["https://example.com/list?q=a&p=4", "https://example.com/list?q=a&p=5"],
+     "query", "p=", 1, 1, [4, 5], "https://example.com/list?q=a&p=3"),
+    (["https://quotes.toscrape.com/page/1/", "https://quotes.toscrape.com/page/2/"],
+     "path", "page/{}", 1, 1, [1, 2], "https://quotes.toscrape.com/page/3/"),
+    (["https://quotes.toscrape.com/", "https://quotes.toscrape.com/page/2/"],
+     "path", "page/{}", 1, 1, [1, 2], "https://quotes.toscrape.com/page/3/"),
+    (["https://books.toscrape.com/catalogue/page-1.html", "https://books.toscrape.com/catalogue/page-2.html"],
+     "path", "page-{}.html", 1, 1, [1, 2], "https://books.toscrape.com/catalogue/page-3.html"),
+    (["https://example.com/s?q=a&start=0", "https://example.com/s?q=a&start=10", "https://example.com/s?q=a&start=20"],
+     "query", "start=", 10, 0, [1, 2, 3], "https://example.com/s?q=a&start=20"),
+    (["https://example.com/s?q=a", "https://example.com/s?q=a&start=10"],
+     "query", "start=", 10, 0, [1, 2], "https://example.com/s?q=a&start=20"),
+    (["https://example.com/items", "https://example.com/items?offset=25&limit=25"],
+     "query", "offset=", 25, 0, [1, 2], "https://example.com/items?offset=50&limit=25"),
+    (["https://example.com/app#page=1", "https://example.com/app#page=2"],
+     "fragment", "page=", 1, 1, [1, 2], "https://example.com/app#page=3"),
+    (["https://example.com/app#/p/1", "https://example.com/app#/p/2"],
+     "fragment", "p/{}", 1, 1, [1, 2], "https://example.com/app#/p/3"),
+    (["https://example.com/2024/05/items/1", "https://example.com/2024/05/items/2"],
+     "path", "items/{}", 1, 1, [1, 2], "https://example.com/2024/05/items/3"),
+    (["https://example.com:8080/1", "https://example.com:8080/2"],
+     "path", "/{}", 1, 1, [1, 2], "https://example.com:8080/3"),
+]
+
+
+@pytest.mark.parametrize("urls, location, key, step, base, numbers, page_three", LEARNED)
+def test_learn_parses_and_generates(urls, location, key, step, base, numbers, page_three):
+    model = PaginationModel.learn(urls)
+    assert (model.location, model.key, model.step, model.base) == (location, key, step, base)
+    assert model.page_numbers(urls) == numbers
+    assert model.url_for(3) == page_three
+
+
+@pytest.mark.parametrize("urls, first_page", [
+    (["https://quotes.toscrape.com/", "https://quotes.toscrape.com/page/2/"], "https://quotes.toscrape.com/"),
+    (["https://example.com/s?q=a", "https://example.com/s?q=a&start=10"], "https://example.com/s?q=a"),
+    (["https://example.com/list?page=1", "https://example.com/list?page=2"], "https://example.com/list?page=1"),
+])
+def test_page_one_round_trips(urls, first_page):
+    model = PaginationModel.learn(urls)
+    assert model.url_for(1) == first_page
+    assert model.page_number(first_page) == 1
+
+
+@pytest.mark.parametrize("urls", [
+    ["https://example.com/feed?cursor=abc", "https://example.com/feed?cursor=xyz"],
+    ["https://example.com/feed", "https://example.com/feed?after=eyJpZCI6NDJ9"],
+])
+def test_cursor_tokens_are_recognised_but_not_numbered(urls):
+    model = PaginationModel.learn(urls)
+    assert model.kind == "cursor"
+    assert not model.can_generate
+    assert model.page_number(urls[-1]) is None
+    with pytest.raises(ValueError):
+        model.url_for(2)
+
+
+@pytest.mark.parametrize("urls, numbers", [
+    (["https://example.com/list?page=1", "https://example.com/list?page=3"], [1, 3]),
+    (["https://quotes.toscrape.com/page/1/", "https://quotes.toscrape.com/page/3/"], [1, 3]),
+])
+def test_page_one_to_three_is_a_skip_not_a_step(urls, numbers):
+    model = PaginationModel.learn(urls)
+    assert model.step == 1
+    assert model.page_numbers(urls) == numbers
+
+
+@pytest.mark.parametrize("urls", [
+    ["https://example.com/about", "https://example.com/contact"],
+    ["https://example.com/list?page=2", "https://example.com/list?page=2"],
+    [],
+])
+def test_learn_gives_up_without_a_moving_position(urls):
+    assert PaginationModel.learn(urls) is None
+
+
+def test_unrelated_url_has_no_page_number():
+    model = PaginationModel.learn(["https://example.com/list?page=1", "https://example.com/list?page=2"])
+    assert model.page_number("https://example.com/other") is None
+
+
+@pytest.mark.parametrize("url, number", [
+    ("https://example.com/list?page=7", 7),
+    ("https://example.com/list?q=a&p=3", 3),
+    ("https://quotes.toscrape.com/page/4/", 4),
+    ("https://example.com/items/12", 12),
+    ("https://example.com/items", 1),
+])
+def test_get_page_number(url, number):
+    assert get_page_number(url) == number
@@ -0,0 +1,77 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import scraper
+from scraper import HostRateLimiter
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A fake monotonic clock that asyncio.sleep advances instantly."""
+    state = SimpleNamespace(now=1000.0)
+
+    async def sleep(seconds):
+        state.now += seconds
+
+    monkeypatch.setattr(scraper, "time", SimpleNamespace(monotonic=lambda: state.now))
+    monkeypatch.setattr(scraper.asyncio, "sleep", sleep)
+    return state
+
+
+def waits(limiter, urls):
+    async def run():
+        return [await limiter.wait(url) for url in urls]
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("rate, burst, count, delays", [
+    (2, 1, 3, [0, 0.5, 0.5]),
+    (2, 3, 5, [0, 0, 0, 0.5, 0.5]),
+    (0.5, 1, 2, [0, 2]),
+    (0, 1, 3, [0, 0, 0]),  # no limit
+])
+def test_back_to_back_requests(clock, rate, burst, count, delays):
+    limiter = HostRateLimiter(rate=rate, burst=burst, jitter=0)
+    assert waits(limiter, ["https://example.com/"] * count) == pytest.approx(delays)
+
+
+def test_tokens_refill_while_idle(clock):
+    limiter = HostRateLimiter(rate=1, burst=2, jitter=0)
+    assert waits(limiter, ["https://example.com/"] * 3) == pytest.approx([0, 0, 1])
+    clock.now += 1.5
+    assert waits(limiter, ["https://example.com/"] * 2) == pytest.approx([0, 0.5])
+    clock.now += 60  # refill is capped at the burst
+    assert waits(limiter, ["https://example.com/"] * 3) == pytest.approx([0, 0, 1])
+
+
+@pytest.mark.parametrize("urls, delays", [
+    (["https://example.com/a", "https://www.example.com/b"], [0, 1]),
+    (["https://www.example.com/a", "https://example.com/b"], [0, 1]),
+    (["https://example.com/a", "https://other.example/b"], [0, 0]),
+    (["https://shop.example.com/a", "https://example.com/b"], [0, 0]),
+])
+def test_hosts_share_a_bucket_only_up_to_www(clock, urls, delays):
+    limiter = HostRateLimiter(rate=1, burst=1, jitter=0)
+    assert waits(limiter, urls) == pytest.approx(delays)
+
+
+@pytest.mark.parametrize("configured_host, url", [
+    ("example.com", "https://www.example.com/"),
+    ("www.example.com", "https://example.com/"),
+    ("example.com", "https://example.com/"),
+])
+def test_per_host_limits_ignore_www(clock, configured_host, url):
+    limiter = HostRateLimiter(rate=1, burst=1, jitter=0)
+    limiter.configure(configured_host, rate=4, burst=1)
+    assert waits(limiter, [url] * 3) == pytest.approx([0, 0.25, 0.25])
+
+
+def test_one_lock_per_host(clock):
+    limiter = HostRateLimiter(rate=10, burst=1, jitter=0)
+    waits(limiter, ["https://example.com/", "https://www.example.com/x"])
+    lock = limiter._locks["example.com"]
+    waits(limiter, ["https://example.com/y"])
+    assert list(limiter._locks) == ["example.com"]
+    assert limiter._locks["example.com"] is lock
@@ -0,0 +1,78 @@
+from types import SimpleNamespace
+
+import pytest
+
+from scraper import CrawlFailure, RetryPolicy, classify_error, classify_response
+
+
+def response(status, **headers):
+    return SimpleNamespace(status=status, headers=headers)
+
+
+@pytest.mark.parametrize("status, headers, kind, retry_after", [
+    (200, {}, None, None),
+    (301, {}, None, None),
+    (429, {"retry-after": "30"}, "throttled", 30.0),
+    (429, {}, "throttled", None),
+    (503, {"retry-after": "Wed, 21 Oct 2026 07:28:00 GMT"}, "throttled", None),
+    (404, {}, "terminal", None),
+    (410, {}, "terminal", None),
+    (500, {}, "transient", None),
+    (403, {}, "transient", None),
+])
+def test_classify_response(status, headers, kind, retry_after):
+    assert classify_response(response(status, **headers)) == (kind, retry_after)
+
+
+def test_classify_response_without_a_response():
+    assert classify_response(None) == (None, None)
+
+
+@pytest.mark.parametrize("message, kind", [
+    ("Target closed", "crash"),
+    ("Target page, context or browser has been closed", "crash"),
+    ("Page crashed", "crash"),
+    ("net::ERR_CONNECTION_RESET at https://example.com", "transient"),
+    ("Timeout 30000ms exceeded.", "transient"),
+    ("something unexpected", "transient"),
+])
+def test_classify_error(message, kind):
+    assert classify_error(Exception(message)) == kind
+
+
+@pytest.mark.parametrize("kind, attempt, low, high", [
+    ("transient", 1, 0, 2),
+    ("transient", 3, 0, 8),
+    ("crash", 2, 0, 4),
+    ("selector_drift", 1, 0, 4),
+    ("throttled", 1, 0, 30),
+    ("transient", 20, 0, 300),  # capped by max_delay
+])
+def test_backoff_stays_within_the_jittered_ceiling(kind, attempt, low, high):
+    policy = RetryPolicy(base_delay=2.0, max_delay=300.0, host_budget=0)
+    delays = [policy.delay(CrawlFailure(kind, "https://example.com/x"), attempt) for _ in range(200)]
+    assert all(low <= delay <= high for delay in delays)
+    assert max(delays) > high / 2  # full jitter spreads over the whole range
+
+
+@pytest.mark.parametrize("failure, attempt", [
+    (CrawlFailure("terminal", "https://example.com/x"), 1),
+    (CrawlFailure("selector_drift", "https://example.com/x"), 3),
+])
+def test_no_retry(failure, attempt):
+    assert RetryPolicy().delay(failure, attempt) is None
+
+
+def test_retry_after_is_honoured_and_capped():
+    policy = RetryPolicy(max_delay=60.0)
+    assert policy.delay(CrawlFailure("throttled", "https://example.com/x", retry_after=30), 1) == 30
+    assert policy.delay(CrawlFailure("throttled", "https://example.com/x", retry_after=600), 1) == 60
+
+
+def test_host_budget_is_shared_and_per_host():
+    policy = RetryPolicy(host_budget=2)
+    failure = CrawlFailure("transient", "https://a.example/page/2")
+    assert policy.delay(failure, 1) is not None
+    assert policy.delay(CrawlFailure("crash", "https://a.example/page/9"), 1) is not None
+    assert policy.delay(failure, 1) is None
+    assert policy.delay(CrawlFailure("transient", "https://b.example/"), 1) is not None
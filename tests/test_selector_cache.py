@@ -0,0 +1,85 @@
+import pytest
+
+from scraper import SelectorCache, probed_selectors
+
+SELECTORS = ["a.next", "button.more", "li.next a", "[rel=next]"]
+
+
+@pytest.mark.parametrize("match, tried", [
+    (None, SELECTORS),
+    (("a.next", None, "Next"), ["a.next"]),
+    (("li.next a", None, "Next"), ["a.next", "button.more", "li.next a"]),
+    (("[rel=next]", None, "Next"), SELECTORS),
+])
+def test_probed_selectors_stop_at_the_match(match, tried):
+    assert probed_selectors(SELECTORS, match) == tried
+
+
+def test_probed_selectors_returns_a_copy():
+    tried = probed_selectors(SELECTORS, None)
+    tried.append("extra")
+    assert SELECTORS[-1] == "[rel=next]"
+
+
+@pytest.mark.parametrize("matched, outcome", [
+    ("li.next a", "learned"),
+    (None, "none"),
+])
+def test_record_outcome_on_an_empty_cache(matched, outcome):
+    cache = SelectorCache()
+    assert cache.record("example.com", "next", matched) == outcome
+
+
+def test_known_selector_is_tried_first():
+    cache = SelectorCache()
+    assert cache.record("example.com", "next", "li.next a") == "learned"
+    assert cache.record("example.com", "next", "li.next a") == "hit"
+    assert cache.ordered("example.com", "next", SELECTORS) == ["li.next a", "a.next", "button.more", "[rel=next]"]
+    assert cache.ordered("other.example", "next", SELECTORS) == SELECTORS
+
+
+def test_known_selector_not_in_the_candidates_is_left_out():
+    cache = SelectorCache()
+    cache.record("example.com", "next", "div.pager a")
+    assert cache.ordered("example.com", "next", SELECTORS) == SELECTORS
+
+
+@pytest.mark.parametrize("tried, misses", [
+    (None, 1),  # every selector counts as tried
+    (["li.next a"], 1),
+    (["a.next"], 0),  # the probe stopped before reaching it
+    ([], 0),
+])
+def test_only_tried_selectors_take_a_miss(tried, misses):
+    cache = SelectorCache()
+    cache.record("example.com", "next", "li.next a")
+    assert cache.record("example.com", "next", None, tried) == "none"
+    assert cache.hosts["example.com"]["next"]["li.next a"]["misses"] == misses
+
+
+def test_selector_is_forgotten_after_consecutive_misses():
+    cache = SelectorCache(max_consecutive_misses=2)
+    cache.record("example.com", "next", "li.next a")
+    cache.record("example.com", "next", None, ["a.next"])  # not reached: no miss
+    cache.record("example.com", "next", None, SELECTORS)
+    assert cache.known_good("example.com", "next") == ["li.next a"]
+    cache.record("example.com", "next", None, SELECTORS)
+    assert cache.known_good("example.com", "next") == []
+
+
+def test_a_hit_resets_consecutive_misses():
+    cache = SelectorCache(max_consecutive_misses=2)
+    cache.record("example.com", "next", "li.next a")
+    cache.record("example.com", "next", None, SELECTORS)
+    cache.record("example.com", "next", "li.next a")
+    cache.record("example.com", "next", None, SELECTORS)
+    stats = cache.hosts["example.com"]["next"]["li.next a"]
+    assert (stats["hits"], stats["misses"], stats["consecutive_misses"]) == (2, 2, 1)
+
+
+def test_cache_round_trips_through_its_file(tmp_path):
+    path = str(tmp_path / "selector_cache.json")
+    cache = SelectorCache(path)
+    cache.record("example.com", "load_more", "button.more")
+    cache.save()
+    assert SelectorCache(path).ordered("example.com", "load_more", SELECTORS)[0] == "button.more"
@@ -0,0 +1,72 @@
+import pytest
+
+from scraper import BloomVisitedStore, DiskVisitedStore, HashVisitedStore, UrlCanonicalizer
+
+
+@pytest.mark.parametrize("url, canonical", [
+    ("HTTPS://Example.COM:443/list/?b=2&a=1", "https://example.com/list?a=1&b=2"),
+    ("http://example.com:80/", "http://example.com/"),
+    ("http://example.com:8080/x", "http://example.com:8080/x"),
+    ("https://example.com/list?utm_source=mail&utm_medium=x&fbclid=1&page=2", "https://example.com/list?page=2"),
+    ("https://example.com/a;jsessionid=ABC123/b", "https://example.com/a/b"),
+    ("https://example.com/a%2fb", "https://example.com/a%2Fb"),
+    ("https://example.com/list#reviews", "https://example.com/list"),
+    ("https://example.com/app#!/page/2", "https://example.com/app#!/page/2"),
+    ("https://example.com/app#/p/3", "https://example.com/app#/p/3"),
+    ("https://example.com/app#page=2", "https://example.com/app#page=2"),
+    ("https://example.com", "https://example.com/"),
+])
+def test_canonical(url, canonical):
+    assert UrlCanonicalizer().canonical(url) == canonical
+
+
+def test_extra_strip_params_and_prefixes():
+    canonicalizer = UrlCanonicalizer(strip_params=["sort", "trk_*"])
+    assert canonicalizer.canonical("https://example.com/?sort=new&trk_a=1&trk_b=2&q=x") == "https://example.com/?q=x"
+
+
+def test_keep_fragments():
+    assert UrlCanonicalizer(keep_fragments=True).canonical("https://example.com/a#top") == "https://example.com/a#top"
+
+
+def test_spellings_of_one_page_share_a_key():
+    canonicalizer = UrlCanonicalizer()
+    keys = {canonicalizer.key(url) for url in ("https://example.com/page/2/", "https://EXAMPLE.com/page/2",
+                                               "https://example.com/page/2?utm_campaign=x#top")}
+    assert len(keys) == 1
+    assert canonicalizer.key("https://example.com/page/3") not in keys
+
+
+@pytest.fixture(params=["hash", "bloom", "disk"])
+def store(request, tmp_path):
+    if request.param == "hash":
+        store = HashVisitedStore(initial_slots=8)  # small, so the table has to grow
+    elif request.param == "bloom":
+        store = BloomVisitedStore(capacity=10_000, error_rate=0.001)
+    else:
+        store = DiskVisitedStore(str(tmp_path / "visited.sqlite"))
+    yield store
+    store.close()
+
+
+def test_store_membership_and_count(store):
+    urls = [f"https://example.com/item/{number}?utm_source=x" for number in range(2000)]
+    store.update(urls)
+    store.update(urls[:10])  # already there
+    assert len(store) == 2000
+    assert all(f"https://example.com/item/{number}/" in store for number in range(2000))
+    assert sum(f"https://other.example/{number}" in store for number in range(2000)) <= 10
+
+
+def test_disk_store_survives_reopening(tmp_path):
+    path = str(tmp_path / "visited.sqlite")
+    store = DiskVisitedStore(path)
+    store.add("https://example.com/page/2")
+    store.close()
+    reopened = DiskVisitedStore(path)
+    assert "https://example.com/page/2/" in reopened
+    assert len(reopened) == 1
+    reopened.close()
+    reset = DiskVisitedStore(path, reset=True)
+    assert len(reset) == 0
+    reset.close()